@@ -27,7 +27,7 @@ class bitbang_test(uhd_example_test_case):
             self.create_addr_args_str(),
             '--bitbang',
         ]
-        (app, run_results) = self.run_example('gpio', args)
+        (app, run_results) = self.run_example('gpio', args, capture_stdout=False)
         # Evaluate pass/fail:
         run_results['passed'] = all([
             app.returncode == 0,
@@ -24,7 +24,7 @@ class list_sensors_test(uhd_example_test_case):
         args = [
             self.create_addr_args_str(),
         ]
-        (app, run_results) = self.run_example('usrp_list_sensors', args)
+        (app, run_results) = self.run_example('usrp_list_sensors', args, capture_stdout=False)
         # Evaluate pass/fail:
         run_results['passed'] = all([
             app.returncode == 0,
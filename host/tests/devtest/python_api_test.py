@@ -41,8 +41,7 @@ class uhd_python_api_test(uhd_test_case):
         run_results['passed'] = all([
             app.returncode == 0,
         ])
-        self.log.info('STDERR Output:')
-        self.log.info(str(app.stderr))
+        self.log.info("STDERR Output:\n%s", app.stderr)
         for key in sorted(run_results):
             self.log.info('%s = %s', str(key), str(run_results[key]))
             self.report_result(
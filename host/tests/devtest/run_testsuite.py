@@ -16,6 +16,7 @@ import subprocess
 import argparse
 import logging
 from usrp_probe import get_usrp_list
+from uhd_test_base import merge_results_journal
 
 def setup_parser():
     """ Set up argparser """
@@ -114,7 +115,8 @@ def main():
         env['_UHD_DEVTEST_SRC_DIR'] = str(args.src_dir)
         proc = subprocess.Popen(
             [
-                "python", "-m", "unittest", "discover", "-v",
+                # Run the tests with the same interpreter as the runner
+                sys.executable, "-m", "unittest", "discover", "-v",
                 "-s", args.src_dir,
                 "-p", devtest_pattern,
             ],
@@ -125,6 +127,10 @@ def main():
         )
         print(proc.communicate()[0])
         sys.stdout.flush()
+        # If the tests were killed before they could merge their results,
+        # there's a journal left over. Merge it now, so the results file is
+        # up to date.
+        merge_results_journal(env['_UHD_TEST_RESULTSFILE'])
         if proc.returncode != 0:
             tests_passed = False
     print('--- Done testing all attached devices.')
@@ -16,10 +16,23 @@ import unittest
 import re
 import time
 import logging
-from subprocess import Popen, PIPE
+import json
+import subprocess
 import yaml
-from six import iteritems
 from usrp_probe import get_usrp_list
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+
+_WARN_RE = re.compile(r"UHD Warning:\n(?:    .*\n)+")
+_BLANK_RE = re.compile(r"\n\n+")
+
+# Log handlers shared by all test cases, keyed by log file name
+_log_handlers = {}
+
+# Device info of the USRP under test, keyed by device args string
+_usrp_info_cache = {}
 
 #--------------------------------------------------------------------------
 # Helpers
@@ -28,10 +41,22 @@ def filter_warnings(errstr):
     """
     Searches errstr for UHD warnings, removes them, and puts them into a
     separate string.
-    Returns (errstr, warnstr), where errstr no longer has warnings. """
-    warn_re = re.compile("UHD Warning:\n(?:    .*\n)+")
-    warnstr = "\n".join(warn_re.findall(errstr)).strip()
-    errstr = warn_re.sub('', errstr).strip()
+    Returns (errstr, warnstr), where errstr no longer has warnings.
+
+    A warning block is "UHD Warning:" and a newline (anywhere, not only at
+    the start of a line), followed by one or more newline-terminated lines
+    indented by four spaces. The regex can't backtrack across lines, and
+    errstr is scanned only once for both outputs. """
+    kept_parts = []
+    warn_blocks = []
+    pos = 0
+    for match in _WARN_RE.finditer(errstr):
+        kept_parts.append(errstr[pos:match.start()])
+        warn_blocks.append(match.group(0))
+        pos = match.end()
+    kept_parts.append(errstr[pos:])
+    warnstr = "\n".join(warn_blocks).strip()
+    errstr = "".join(kept_parts).strip()
     return (errstr, warnstr)
 
 def filter_stderr(stderr, run_results=None):
@@ -44,10 +69,69 @@ def filter_stderr(stderr, run_results=None):
     run_results = run_results or {}
     errstr, run_results['warnings'] = filter_warnings(stderr)
     # Scan for underruns and sequence errors / dropped packets  not detected in the counter
-    errstr = re.sub("\n\n+", "\n", errstr)
+    errstr = _BLANK_RE.sub("\n", errstr)
     run_results['errors'] = errstr.strip()
     return run_results
 
+def get_usrp_info(args_str):
+    """
+    Returns the info dict of the first USRP matching args_str. Device
+    discovery is slow, so it only runs once per args string; all test cases
+    share the result.
+    """
+    if args_str not in _usrp_info_cache:
+        usrp_list = get_usrp_list(args_str)
+        if not usrp_list:
+            raise RuntimeError(
+                "No USRP found for device args `{}'".format(args_str))
+        _usrp_info_cache[args_str] = usrp_list[0]
+    return _usrp_info_cache[args_str]
+
+def get_results_journal(results_file):
+    """
+    Returns the path to the journal for results_file. Test cases append their
+    results to the journal (one JSON object per line), which is much cheaper
+    than rewriting the whole results file after every test.
+    """
+    return results_file + '.jrnl'
+
+def merge_results_journal(results_file):
+    """
+    Merge the journal for results_file into results_file (which is a YAML
+    file), then remove the journal. Does nothing if there is no journal.
+    """
+    journal_file = get_results_journal(results_file)
+    if not os.path.isfile(journal_file):
+        return
+    results = {}
+    if os.path.isfile(results_file):
+        with open(results_file) as results_fd:
+            results = yaml.load(results_fd, Loader=YamlLoader) or {}
+    with open(journal_file) as journal_fd:
+        for line in journal_fd:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Most likely a partial line from an interrupted run
+                continue
+            test_results = results \
+                .setdefault(entry['serial'], {}) \
+                .setdefault(entry['test'], {})
+            for testname, values in entry['results'].items():
+                test_results.setdefault(testname, {}).update(values)
+    # Write to a temporary file first, so an interrupted write can't leave a
+    # truncated results file behind
+    tmp_results_file = results_file + '.tmp'
+    with open(tmp_results_file, 'w') as results_fd:
+        yaml.dump(
+            results,
+            results_fd,
+            Dumper=YamlDumper,
+            default_flow_style=False
+        )
+    os.replace(tmp_results_file, results_file)
+    os.remove(journal_file)
+
 #--------------------------------------------------------------------------
 # Application
 #--------------------------------------------------------------------------
@@ -56,6 +140,12 @@ class shell_application(object):
     Wrapper for applications that are in $PATH.
     Note: The CMake infrastructure makes sure all examples and utils are in $PATH.
     """
+    # Time (time.monotonic()) at which the last shell application exited,
+    # i.e., when the device was last released. We don't know what happened to
+    # the device before this module was loaded, so assume it was released
+    # just now.
+    last_release_time = time.monotonic()
+
     def __init__(self, name):
         self.name = name
         self.stdout = ''
@@ -63,25 +153,31 @@ class shell_application(object):
         self.returncode = None
         self.exec_time = None
 
-    def run(self, args=None):
-        """Test executor."""
+    def run(self, args=None, capture_stdout=True, capture_stderr=True):
+        """Test executor.
+
+        If capture_stdout or capture_stderr are False, the respective stream
+        is discarded instead of being read back, and self.stdout or
+        self.stderr will be None.
+        """
         args = args or []
         cmd_line = [self.name]
         cmd_line.extend(args)
         start_time = time.time()
-        env = os.environ
-        env["UHD_LOG_FASTPATH_DISABLE"] = "1"
+        env = dict(os.environ, UHD_LOG_FASTPATH_DISABLE="1")
         try:
-            proc = Popen(
+            proc = subprocess.run(
                 cmd_line,
-                stdout=PIPE,
-                stderr=PIPE,
-                close_fds=True,
-                env=env
+                stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
+                stderr=subprocess.PIPE if capture_stderr else subprocess.DEVNULL,
+                env=env,
+                text=True,
+                check=False,
             )
-            self.stdout, self.stderr = proc.communicate()
+            self.stdout, self.stderr = proc.stdout, proc.stderr
             self.returncode = proc.returncode
             self.exec_time = time.time() - start_time
+            shell_application.last_release_time = time.monotonic()
         except OSError as ex:
             raise RuntimeError("Failed to execute command: `{}'\n{}"
                                .format(cmd_line, str(ex)))
@@ -95,6 +191,11 @@ class uhd_test_case(unittest.TestCase):
     Base class for UHD test cases.
     """
     test_name = '--TEST--'
+    # Some devices need time to reclaim themselves after an application
+    # released them. This is the time (in seconds) and the device types that
+    # require it.
+    RECLAIM_WAIT_S = 15
+    RECLAIM_WAIT_TYPES = ('x300',)
 
     def set_up(self):
         """
@@ -102,19 +203,26 @@ class uhd_test_case(unittest.TestCase):
         """
         pass
 
+    @classmethod
+    def setUpClass(cls):
+        cls.args_str = os.getenv('_UHD_TEST_ARGS_STR', "")
+        cls.usrp_info = get_usrp_info(cls.args_str)
+        cls.results_file = os.getenv('_UHD_TEST_RESULTSFILE', "")
+
+    @classmethod
+    def tearDownClass(cls):
+        # Results are journaled per test, and merged into the results file
+        # once all tests of this class are done. If the test process gets
+        # killed, run_testsuite.py merges what's left in the journal.
+        if cls.results_file:
+            merge_results_journal(cls.results_file)
+
     def setUp(self):
         self.name = self.__class__.__name__
         self.test_id = self.id().split('.')[-1]
-        self.results = {}
-        self.results_file = os.getenv('_UHD_TEST_RESULTSFILE', "")
-        if self.results_file and os.path.isfile(self.results_file):
-            self.results = yaml.safe_load(open(self.results_file).read()) or {}
-        self.args_str = os.getenv('_UHD_TEST_ARGS_STR', "")
-        self.usrp_info = get_usrp_list(self.args_str)[0]
-        if self.usrp_info['serial'] not in self.results:
-            self.results[self.usrp_info['serial']] = {}
-        if self.name not in self.results[self.usrp_info['serial']]:
-            self.results[self.usrp_info['serial']][self.name] = {}
+        self.results_dirty = False
+        # Only holds the results of this test, see tearDown()
+        self.results = {self.usrp_info['serial']: {self.name: {}}}
         self.setup_logger()
         self.set_up()
 
@@ -126,17 +234,21 @@ class uhd_test_case(unittest.TestCase):
         #self.print_level = int(os.getenv('_UHD_TEST_PRINT_LEVEL', logging.WARNING))
         self.log_level = logging.DEBUG
         self.print_level = logging.WARNING
-        file_handler = logging.FileHandler(self.log_file)
-        file_handler.setLevel(self.log_level)
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(self.print_level)
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
+        if self.log_file not in _log_handlers:
+            file_handler = logging.FileHandler(self.log_file)
+            file_handler.setLevel(self.log_level)
+            console_handler = logging.StreamHandler()
+            console_handler.setLevel(self.print_level)
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            file_handler.setFormatter(formatter)
+            console_handler.setFormatter(formatter)
+            _log_handlers[self.log_file] = (file_handler, console_handler)
         self.log.setLevel(logging.DEBUG)
-        self.log.addHandler(file_handler)
-        self.log.addHandler(console_handler)
-        self.log.info("Starting test with device: %s", str(self.args_str))
+        # addHandler() skips handlers that are already attached, so running
+        # several tests of the same class won't duplicate log output
+        for handler in _log_handlers[self.log_file]:
+            self.log.addHandler(handler)
+        self.log.info("Starting test with device: %s", self.args_str)
 
     def tear_down(self):
         """Nothing to do."""
@@ -144,18 +256,40 @@ class uhd_test_case(unittest.TestCase):
 
     def tearDown(self):
         self.tear_down()
-        if self.results_file:
-            open(self.results_file, 'w').write(
-                yaml.dump(self.results, default_flow_style=False))
-        time.sleep(15)
+        if self.results_file and self.results_dirty:
+            serial = self.usrp_info['serial']
+            journal_entry = {
+                'serial': serial,
+                'test': self.name,
+                'results': self.results[serial][self.name],
+            }
+            with open(get_results_journal(self.results_file), 'a') as journal:
+                journal.write(json.dumps(journal_entry) + '\n')
+        self.wait_for_reclaim()
+
+    def wait_for_reclaim(self):
+        """
+        Wait until the device had RECLAIM_WAIT_S seconds since it was last
+        released. Returns immediately for devices that don't need to reclaim
+        themselves, or if enough time has already passed.
+        """
+        if self.usrp_info.get('type') not in self.RECLAIM_WAIT_TYPES:
+            return
+        remaining = shell_application.last_release_time \
+            + self.RECLAIM_WAIT_S - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
 
     def report_result(self, testname, key, value):
         """ Store a result as a key/value pair.
-        After completion, all results for one test are written to the results file.
+        After completion, all results for one test are written to the results
+        journal, and merged into the results file once all tests of the class
+        are done.
         """
-        if not self.results[self.usrp_info['serial']][self.name].has_key(testname):
+        if testname not in self.results[self.usrp_info['serial']][self.name]:
             self.results[self.usrp_info['serial']][self.name][testname] = {}
         self.results[self.usrp_info['serial']][self.name][testname][key] = value
+        self.results_dirty = True
 
     def create_addr_args_str(self, argname="args"):
         """ Returns an args string, usually '--args "type=XXX,serial=YYY" """
@@ -187,23 +321,24 @@ class uhd_example_test_case(uhd_test_case):
         """
         raise NotImplementedError
 
-    def run_example(self, example, args):
+    def run_example(self, example, args, capture_stdout=True):
         """
         Run `example' (which has to be a UHD example or utility) with `args'.
         Return results and the app object.
 
+        Set capture_stdout to False if the test doesn't need app.stdout.
+
         Note: UHD_LOG_FASTPATH_DISABLE will be set to 1.
         """
         self.log.info("Running example: `%s %s'", example, " ".join(args))
         app = shell_application(example)
-        app.run(args)
+        app.run(args, capture_stdout=capture_stdout)
         run_results = {
             'return_code': app.returncode,
             'passed': False,
         }
         run_results = filter_stderr(app.stderr, run_results)
-        self.log.info('STDERR Output:')
-        self.log.info(str(app.stderr))
+        self.log.info("STDERR Output:\n%s", app.stderr)
         return (app, run_results)
 
 
@@ -214,13 +349,13 @@ class uhd_example_test_case(uhd_test_case):
                 test_name,
                 key, run_results[key]
             )
-        if run_results.has_key('passed'):
+        if 'passed' in run_results:
             self.report_result(
                 test_name,
                 'status',
                 'Passed' if run_results['passed'] else 'Failed',
             )
-        if run_results.has_key('errors'):
+        if 'errors' in run_results:
             self.report_result(
                 test_name,
                 'errors',
@@ -232,9 +367,9 @@ class uhd_example_test_case(uhd_test_case):
         Hook for test runner. Needs to be a class method that starts with 'test'.
         Calls run_test().
         """
-        for test_name, test_args in iteritems(self.test_params):
-            time.sleep(15) # Wait for X300 devices to reclaim them
-            if not test_args.has_key('products') \
+        for test_name, test_args in self.test_params.items():
+            self.wait_for_reclaim()
+            if 'products' not in test_args \
                     or (self.usrp_info['product'] in test_args.get('products', [])):
                 run_results = self.run_test(test_name, test_args)
                 passed = bool(run_results)
@@ -244,13 +379,17 @@ class uhd_example_test_case(uhd_test_case):
                 if not passed:
                     print("Error log:", file=sys.stderr)
                     print(errors)
-                self.assertTrue(
-                    passed,
-                    msg="Errors occurred during test `{t}'. "
+                    # Only serialize the run results if we actually fail
+                    self.fail(
+                        "Errors occurred during test `{t}'. "
                         "Check log file for details.\n"
                         "Run results:\n{r}".format(
                             t=test_name,
-                            r=yaml.dump(run_results, default_flow_style=False)
+                            r=yaml.dump(
+                                run_results,
+                                Dumper=YamlDumper,
+                                default_flow_style=False
+                            )
                         )
-                )
+                    )
 
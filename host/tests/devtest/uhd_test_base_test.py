@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+#
+# Copyright 2018 Ettus Research, a National Instruments Company
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Unit tests for the devtest base module helpers (results journal, warning
+filter). These don't need a device, run them from this directory with:
+
+    python3 -m unittest uhd_test_base_test
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import yaml
+from uhd_test_base import get_results_journal, merge_results_journal
+from uhd_test_base import filter_warnings
+
+
+class results_journal_test(unittest.TestCase):
+    """
+    Test merging the results journal into the YAML results file
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.results_file = os.path.join(self.tmp_dir, 'results.log')
+        self.journal_file = get_results_journal(self.results_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_results(self, results):
+        """Write results to the YAML results file"""
+        with open(self.results_file, 'w') as results_fd:
+            yaml.safe_dump(results, results_fd, default_flow_style=False)
+
+    def read_results(self):
+        """Read back the YAML results file"""
+        with open(self.results_file) as results_fd:
+            return yaml.safe_load(results_fd)
+
+    def write_journal(self, entries, trailer=''):
+        """Write entries (and an optional raw trailer) to the journal"""
+        with open(self.journal_file, 'w') as journal_fd:
+            for entry in entries:
+                journal_fd.write(json.dumps(entry) + '\n')
+            journal_fd.write(trailer)
+
+    def test_no_journal(self):
+        """Without a journal, the results file is left alone"""
+        merge_results_journal(self.results_file)
+        self.assertFalse(os.path.exists(self.results_file))
+        self.write_results({'1234': {'foo_test': {'a': {'passed': True}}}})
+        merge_results_journal(self.results_file)
+        self.assertEqual(
+            self.read_results(),
+            {'1234': {'foo_test': {'a': {'passed': True}}}})
+
+    def test_empty_journal(self):
+        """An empty journal keeps the existing results and is removed"""
+        existing = {'1234': {'foo_test': {'a': {'passed': True}}}}
+        self.write_results(existing)
+        self.write_journal([])
+        merge_results_journal(self.results_file)
+        self.assertEqual(self.read_results(), existing)
+        self.assertFalse(os.path.exists(self.journal_file))
+
+    def test_merge_into_existing(self):
+        """Journal entries are added to the existing results"""
+        self.write_results({'1234': {'foo_test': {'a': {'passed': True}}}})
+        self.write_journal([
+            {'serial': '1234', 'test': 'bar_test',
+             'results': {'b': {'passed': False}}},
+            {'serial': '5678', 'test': 'foo_test',
+             'results': {'a': {'passed': True}}},
+        ])
+        merge_results_journal(self.results_file)
+        self.assertEqual(self.read_results(), {
+            '1234': {
+                'foo_test': {'a': {'passed': True}},
+                'bar_test': {'b': {'passed': False}},
+            },
+            '5678': {'foo_test': {'a': {'passed': True}}},
+        })
+        self.assertFalse(os.path.exists(self.journal_file))
+        self.assertFalse(os.path.exists(self.results_file + '.tmp'))
+
+    def test_duplicate_keys(self):
+        """Later entries update the values of earlier ones, key by key"""
+        self.write_results(
+            {'1234': {'foo_test': {'a': {'passed': False, 'rate': 1}}}})
+        self.write_journal([
+            {'serial': '1234', 'test': 'foo_test',
+             'results': {'a': {'passed': True}}},
+            {'serial': '1234', 'test': 'foo_test',
+             'results': {'a': {'errors': ''}, 'b': {'passed': True}}},
+        ])
+        merge_results_journal(self.results_file)
+        self.assertEqual(self.read_results(), {
+            '1234': {'foo_test': {
+                'a': {'passed': True, 'rate': 1, 'errors': ''},
+                'b': {'passed': True},
+            }},
+        })
+
+    def test_partial_line(self):
+        """A partial last line (from an interrupted run) is skipped"""
+        self.write_journal(
+            [{'serial': '1234', 'test': 'foo_test',
+              'results': {'a': {'passed': True}}}],
+            trailer='{"serial": "1234", "te')
+        merge_results_journal(self.results_file)
+        self.assertEqual(
+            self.read_results(),
+            {'1234': {'foo_test': {'a': {'passed': True}}}})
+
+
+class filter_warnings_test(unittest.TestCase):
+    """
+    Test separating UHD warnings from the rest of stderr
+    """
+    def test_no_warnings(self):
+        """Output without warnings is only stripped"""
+        self.assertEqual(filter_warnings("foo\nbar\n"), ("foo\nbar", ""))
+
+    def test_warning_blocks(self):
+        """Warning blocks are moved to the warning string"""
+        errstr = "foo\nUHD Warning:\n    one\n    two\nbar\n" \
+                 "UHD Warning:\n    three\n"
+        self.assertEqual(filter_warnings(errstr), (
+            "foo\nbar",
+            "UHD Warning:\n    one\n    two\n\nUHD Warning:\n    three",
+        ))
+
+    def test_mid_line_warning(self):
+        """Warnings which don't start a line are removed, too"""
+        self.assertEqual(
+            filter_warnings("fooUHD Warning:\n    one\nbar"),
+            ("foobar", "UHD Warning:\n    one"))
+
+    def test_incomplete_warning(self):
+        """A warning header without indented lines is kept"""
+        errstr = "UHD Warning:\nfoo\nUHD Warning:\n    unterminated"
+        self.assertEqual(filter_warnings(errstr), (errstr, ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
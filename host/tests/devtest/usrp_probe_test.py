@@ -34,7 +34,7 @@ class uhd_usrp_probe_test(uhd_example_test_case):
         ]
         if test_args.get('init-only'):
             args.append('--init-only')
-        (app, run_results) = self.run_example('uhd_usrp_probe', args)
+        (app, run_results) = self.run_example('uhd_usrp_probe', args, capture_stdout=False)
         # Evaluate pass/fail:
         run_results['passed'] = all([
             app.returncode == 0,
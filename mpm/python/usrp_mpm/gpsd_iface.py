@@ -182,6 +182,10 @@ class GPSDIfaceExtension(object):
         self._log = self._gpsd_iface.log
 
     def __del__(self):
+        self.close()
+
+    def close(self):
+        """Close the connection to GPSd"""
         self._gpsd_iface.close()
 
     def extend(self, context):
@@ -189,7 +193,7 @@ class GPSDIfaceExtension(object):
         new_methods = [method_name for method_name in dir(self)
                        if not method_name.startswith('_') \
                        and callable(getattr(self, method_name)) \
-                       and method_name != "extend"]
+                       and method_name not in ("extend", "close")]
         for method_name in new_methods:
             new_method = getattr(self, method_name)
             self._log.trace("%s: Adding %s method", context, method_name)
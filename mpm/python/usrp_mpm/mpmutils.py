@@ -10,7 +10,8 @@ Miscellaneous utilities for MPM
 import time
 from contextlib import contextmanager
 
-def poll_with_timeout(state_check, timeout_ms, interval_ms):
+def poll_with_timeout(state_check, timeout_ms, interval_ms,
+                      max_interval_ms=None, backoff=1.0):
     """
     Calls state_check() every interval_ms until it returns a positive value, or
     until a timeout is exceeded.
@@ -28,13 +29,21 @@ def poll_with_timeout(state_check, timeout_ms, interval_ms):
                    sleep for interval_ms milliseconds. Typically, interval_ms
                    should be chosen much smaller than timeout_ms, but not too
                    small for this to become a busy loop.
+    max_interval_ms -- Upper limit for the sleep time when backoff is used.
+                       Defaults to interval_ms, i.e., no backoff.
+    backoff -- After every unsuccessful call to state_check(), the sleep time
+               is multiplied by this factor (up to max_interval_ms). This
+               allows starting with a short interval to catch quick state
+               changes, without polling at that rate for the entire timeout.
     """
     max_time = time.time() + (float(timeout_ms) / 1000)
     interval_s = float(interval_ms) / 1000
+    max_interval_s = float(max_interval_ms or interval_ms) / 1000
     while time.time() < max_time:
         if state_check():
             return True
         time.sleep(interval_s)
+        interval_s = min(interval_s * backoff, max_interval_s)
     return False
 
 def to_native_str(str_or_bstr):
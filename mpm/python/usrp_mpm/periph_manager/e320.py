@@ -260,23 +260,26 @@ class e320(ZynqComponents, PeriphManagerBase):
         # Init Mboard Regs
         self.mboard_regs_control = MboardRegsControl(
             self.mboard_regs_label, self.log)
-        self.mboard_regs_control.get_git_hash()
-        self.mboard_regs_control.get_build_timestamp()
-        self._check_fpga_compat()
-        self._update_fpga_type()
-        self.crossbar_base_port = self.mboard_regs_control.get_xbar_baseport()
-        # Init peripherals
-        self.enable_gps(
-            enable=str2bool(
-                args.get('enable_gps', E320_DEFAULT_ENABLE_GPS)
+        # Keep the register interface open for the whole init sequence
+        with self.mboard_regs_control.batch():
+            self.mboard_regs_control.get_git_hash()
+            self.mboard_regs_control.get_build_timestamp()
+            self._check_fpga_compat()
+            self._update_fpga_type()
+            self.crossbar_base_port = \
+                self.mboard_regs_control.get_xbar_baseport()
+            # Init peripherals
+            self.enable_gps(
+                enable=str2bool(
+                    args.get('enable_gps', E320_DEFAULT_ENABLE_GPS)
+                )
+            )
+            self.enable_fp_gpio(
+                enable=args.get(
+                            'enable_fp_gpio',
+                            E320_DEFAULT_ENABLE_FPGPIO
+                        )
             )
-        )
-        self.enable_fp_gpio(
-            enable=args.get(
-                        'enable_fp_gpio',
-                        E320_DEFAULT_ENABLE_FPGPIO
-                    )
-        )
         # Init clocking
         self._init_ref_clock_and_time(args)
         # Init GPSd iface and GPS sensors
@@ -8,7 +8,6 @@ E320 peripherals
 """
 
 import datetime
-import math
 from usrp_mpm.sys_utils.sysfs_gpio import SysFSGPIO, GPIOBank
 from usrp_mpm.sys_utils.uio import UIO
 
@@ -21,12 +20,20 @@ E320_SFP_TYPES = {
 }
 
 E320_FPGA_TYPES_BY_SFP = {
-    (""):    "",
-    ("1G"):  "1G",
-    ("10G"): "XG",
-    ("A"):   "AA",
+    "":    "",
+    "1G":  "1G",
+    "10G": "XG",
+    "A":   "AA",
 }
 
+# Front panel GPIO voltages (in volts) and their encoding in the EN_3V3/EN_2V5
+# bits of MB_GPIO_CTRL. The index matches the register value.
+E320_FP_GPIO_VOLTAGES = (
+    (1.8, 0),
+    (2.5, 1),
+    (3.3, 2),
+)
+
 class FrontpanelGPIO(GPIOBank):
     """
     Abstraction layer for the front panel GPIO
@@ -68,6 +75,17 @@ class MboardRegsControl(object):
     MB_DBOARD_STATUS  = 0x0044
     MB_XBAR_BASEPORT  = 0x0048
 
+    # Bitfield locations (name, shift, mask) for the MB_DATESTAMP register.
+    # The year is stored as an offset from 2000.
+    MB_DATESTAMP_FIELDS = (
+        ('year',   17, 0x3F),
+        ('month',  23, 0x0F),
+        ('day',    27, 0x1F),
+        ('hour',   12, 0x1F),
+        ('minute',  6, 0x3F),
+        ('second',  0, 0x3F),
+    )
+
     # Bitfield locations for the MB_CLOCK_CTRL register.
     MB_CLOCK_CTRL_PPS_SEL_INT = 0
     MB_CLOCK_CTRL_PPS_SEL_EXT = 1
@@ -100,6 +118,23 @@ class MboardRegsControl(object):
     MB_DBOARD_STATUS_RX_LOCK = 6
     MB_DBOARD_STATUS_TX_LOCK = 7
 
+    # Precomputed bit masks. The ones XOR'ed from 0xFFFFFFFF clear a field
+    # during read-modify-write, the others select a field on readback.
+    _FP_GPIO_CTRL_MASK = 0xFFFFFFFF ^ ((0b1 << MB_GPIO_CTRL_BUFFER_OE_N) | \
+                                       (0b1 << MB_GPIO_CTRL_EN_VAR_SUPPLY))
+    _FP_GPIO_VOLTAGE_MASK = 0xFFFFFFFF ^ ((0b1 << MB_GPIO_CTRL_EN_3V3) | \
+                                          (0b1 << MB_GPIO_CTRL_EN_2V5))
+    _FP_GPIO_VOLTAGE_RB_MASK = 0x3 << MB_GPIO_CTRL_EN_2V5
+    _FP_GPIO_MASTER_MASK = 0xfff
+    _FP_GPIO_RADIO_SRC_MASK = 0xffffff
+    _CLK_REF_SEL_MASK = 0xFFFFFFFF ^ (0b1 << MB_CLOCK_CTRL_REF_SEL)
+    _REF_CLK_LOCKED_MASK = 0b1 << MB_CLOCK_CTRL_REF_CLK_LOCKED
+    _GPS_CTRL_PWR_EN_MASK = 0xFFFFFFFF ^ (0b1 << MB_GPS_CTRL_PWR_EN)
+    _GPS_STATUS_LOCK_MASK = 0b1 << MB_GPS_STATUS_LOCK
+    _GPS_STATUS_MASK = 0x1F
+    _DBOARD_STATUS_TX_LOCK_MASK = 0b1 << MB_DBOARD_STATUS_TX_LOCK
+    _DBOARD_STATUS_RX_LOCK_MASK = 0b1 << MB_DBOARD_STATUS_RX_LOCK
+
     def __init__(self, label, log):
         self.log = log
         self.regs = UIO(
@@ -108,6 +143,10 @@ class MboardRegsControl(object):
         )
         self.poke32 = self.regs.poke32
         self.peek32 = self.regs.peek32
+        # These are fixed for a given FPGA image, so they only get read once
+        self._compat_number = None
+        self._git_hash = None
+        self._build_timestamp = None
 
     def get_compat_number(self):
         """get FPGA compat number
@@ -116,24 +155,36 @@ class MboardRegsControl(object):
         The return is a tuple of
         2 numbers: (major compat number, minor compat number )
         """
-        with self.regs:
-            compat_number = self.peek32(self.MB_COMPAT_NUM)
-        minor = compat_number & 0xff
-        major = (compat_number>>16) & 0xff
-        return (major, minor)
+        if self._compat_number is None:
+            with self.regs:
+                compat_number = self.peek32(self.MB_COMPAT_NUM)
+            minor = compat_number & 0xff
+            major = (compat_number>>16) & 0xff
+            self._compat_number = (major, minor)
+        return self._compat_number
+
+    def batch(self):
+        """
+        Returns a context manager that keeps the register interface open for
+        its entire lifetime. Use this to group multiple register accesses
+        into a single UIO session:
+
+        >>> with mboard_regs_control.batch():
+        ...     mboard_regs_control.enable_fp_gpio(True)
+        ...     mboard_regs_control.enable_gps(True)
+        """
+        return self.regs
 
     def enable_fp_gpio(self, enable):
         """ Enable front panel GPIO buffers and power supply
         and set voltage 3.3 V
         """
-        self.set_fp_gpio_voltage(3.3)
-        mask = 0xFFFFFFFF ^ ((0b1 << self.MB_GPIO_CTRL_BUFFER_OE_N) | \
-                             (0b1 << self.MB_GPIO_CTRL_EN_VAR_SUPPLY))
         with self.regs:
-            reg_val = self.peek32(self.MB_GPIO_CTRL) & mask
+            self._set_fp_gpio_voltage(3.3)
+            reg_val = self.peek32(self.MB_GPIO_CTRL) & self._FP_GPIO_CTRL_MASK
             reg_val = reg_val | (not enable << self.MB_GPIO_CTRL_BUFFER_OE_N) | \
                                 (enable << self.MB_GPIO_CTRL_EN_VAR_SUPPLY)
-            self.log.trace("Writing MB_GPIO_CTRL to 0x{:08X}".format(reg_val))
+            self.log.trace("Writing MB_GPIO_CTRL to 0x%08X", reg_val)
             return self.poke32(self.MB_GPIO_CTRL, reg_val)
 
     def set_fp_gpio_voltage(self, value):
@@ -146,31 +197,35 @@ class MboardRegsControl(object):
         Arguments:
             value : 3.3
         """
-        assert any([math.isclose(value, nn, abs_tol=0.1) for nn in (3.3,)]),\
-            "FP GPIO currently only supports 3.3V"
-        if math.isclose(value, 1.8, abs_tol=0.1):
-            voltage_reg = 0
-        elif math.isclose(value, 2.5, abs_tol=0.1):
-            voltage_reg = 1
-        elif math.isclose(value, 3.3, abs_tol=0.1):
-            voltage_reg = 2
-        mask = 0xFFFFFFFF ^ ((0b1 << self.MB_GPIO_CTRL_EN_3V3) | \
-                             (0b1 << self.MB_GPIO_CTRL_EN_2V5))
         with self.regs:
-            reg_val = self.peek32(self.MB_GPIO_CTRL) & mask
-            reg_val = reg_val | (voltage_reg << self.MB_GPIO_CTRL_EN_2V5)
-            self.log.trace("Writing MB_GPIO_CTRL to 0x{:08X}".format(reg_val))
-            return self.poke32(self.MB_GPIO_CTRL, reg_val)
+            return self._set_fp_gpio_voltage(value)
+
+    def _set_fp_gpio_voltage(self, value):
+        """
+        Like set_fp_gpio_voltage(), but assumes the caller has already opened
+        the register interface.
+        """
+        if abs(value - 3.3) > 0.1:
+            raise RuntimeError("FP GPIO currently only supports 3.3V")
+        for voltage, voltage_reg in E320_FP_GPIO_VOLTAGES:
+            if abs(value - voltage) <= 0.1:
+                break
+        else:
+            raise RuntimeError(
+                "Unsupported FP GPIO voltage: {} V".format(value))
+        reg_val = self.peek32(self.MB_GPIO_CTRL) & self._FP_GPIO_VOLTAGE_MASK
+        reg_val = reg_val | (voltage_reg << self.MB_GPIO_CTRL_EN_2V5)
+        self.log.trace("Writing MB_GPIO_CTRL to 0x%08X", reg_val)
+        return self.poke32(self.MB_GPIO_CTRL, reg_val)
 
     def get_fp_gpio_voltage(self):
         """
         Get Front Panel GPIO voltage (in volts)
         """
-        mask = 0x3 << self.MB_GPIO_CTRL_EN_2V5
-        voltage = [1.8, 2.5, 3.3]
         with self.regs:
-            reg_val = (self.peek32(self.MB_GPIO_CTRL) & mask) >> self.MB_GPIO_CTRL_EN_2V5
-        return voltage[reg_val]
+            reg_val = (self.peek32(self.MB_GPIO_CTRL) &
+                       self._FP_GPIO_VOLTAGE_RB_MASK) >> self.MB_GPIO_CTRL_EN_2V5
+        return E320_FP_GPIO_VOLTAGES[reg_val][0]
 
     def set_fp_gpio_master(self, value):
         """set driver for front panel GPIO
@@ -187,7 +242,7 @@ class MboardRegsControl(object):
            1: means the pin is driven by PS
         """
         with self.regs:
-            return self.peek32(self.MB_GPIO_MASTER) & 0xfff
+            return self.peek32(self.MB_GPIO_MASTER) & self._FP_GPIO_MASTER_MASK
 
     def set_fp_gpio_radio_src(self, value):
         """set driver for front panel GPIO
@@ -206,7 +261,21 @@ class MboardRegsControl(object):
            01: means the pin is driven by radio 1
         """
         with self.regs:
-            return self.peek32(self.MB_GPIO_RADIO_SRC) & 0xffffff
+            return self.peek32(self.MB_GPIO_RADIO_SRC) & \
+                self._FP_GPIO_RADIO_SRC_MASK
+
+    def get_fp_gpio_config(self):
+        """get the front panel GPIO master and radio source settings with a
+           single register session.
+           The return value is a tuple (master, radio_src), see
+           get_fp_gpio_master() and get_fp_gpio_radio_src().
+        """
+        with self.regs:
+            return (
+                self.peek32(self.MB_GPIO_MASTER) & self._FP_GPIO_MASTER_MASK,
+                self.peek32(self.MB_GPIO_RADIO_SRC) & \
+                    self._FP_GPIO_RADIO_SRC_MASK,
+            )
 
     def get_build_timestamp(self):
         """
@@ -214,17 +283,25 @@ class MboardRegsControl(object):
         The return is datetime string with the  ISO 8601 format
         (YYYY-MM-DD HH:MM:SS.mmmmmm)
         """
+        if self._build_timestamp is None:
+            self._build_timestamp = self._read_build_timestamp()
+        return self._build_timestamp
+
+    def _read_build_timestamp(self):
+        """
+        Reads the build date/time for the FPGA image from the registers. See
+        get_build_timestamp().
+        """
         with self.regs:
             datestamp_rb = self.peek32(self.MB_DATESTAMP)
         if datestamp_rb > 0:
-            dt_str = datetime.datetime(
-                year=((datestamp_rb>>17)&0x3F)+2000,
-                month=(datestamp_rb>>23)&0x0F,
-                day=(datestamp_rb>>27)&0x1F,
-                hour=(datestamp_rb>>12)&0x1F,
-                minute=(datestamp_rb>>6)&0x3F,
-                second=((datestamp_rb>>0)&0x3F))
-            self.log.trace("FPGA build timestamp: {}".format(str(dt_str)))
+            fields = {
+                name: (datestamp_rb >> shift) & mask
+                for name, shift, mask in self.MB_DATESTAMP_FIELDS
+            }
+            fields['year'] += 2000
+            dt_str = datetime.datetime(**fields)
+            self.log.trace("FPGA build timestamp: %s", dt_str)
             return str(dt_str)
         else:
             # Compatibility with FPGAs without datestamp capability
@@ -236,23 +313,30 @@ class MboardRegsControl(object):
         The return is a tuple of
         2 numbers: (short git hash, bool: is the tree dirty?)
         """
+        if self._git_hash is not None:
+            return self._git_hash
         with self.regs:
             git_hash_rb = self.peek32(self.MB_GIT_HASH)
         git_hash = git_hash_rb & 0x0FFFFFFF
         tree_dirty = ((git_hash_rb & 0xF0000000) > 0)
         dirtiness_qualifier = 'dirty' if tree_dirty else 'clean'
-        self.log.trace("FPGA build GIT Hash: {:07x} ({})".format(
-            git_hash, dirtiness_qualifier))
-        return (git_hash, dirtiness_qualifier)
+        self.log.trace("FPGA build GIT Hash: %07x (%s)",
+                       git_hash, dirtiness_qualifier)
+        self._git_hash = (git_hash, dirtiness_qualifier)
+        return self._git_hash
 
-    def set_time_source(self, time_source, ref_clk_freq):
+    def set_time_source(self, time_source, ref_clk_freq, force_glitchless=True):
         """
         Set time source
+
+        If force_glitchless is True, the PPS select bits are cleared with a
+        separate write before the new value is written. Set it to False to
+        update the register with a single write.
         """
         pps_sel_val = 0x0
         if time_source == 'internal' or time_source == 'gpsdo':
             self.log.trace("Setting time source to internal (GPSDO)"
-                           "({:.1f} MHz reference)...".format(ref_clk_freq))
+                           "(%.1f MHz reference)...", ref_clk_freq)
             pps_sel_val = 0b1 << self.MB_CLOCK_CTRL_PPS_SEL_INT
         elif time_source == 'external':
             self.log.debug("Setting time source to external...")
@@ -260,11 +344,13 @@ class MboardRegsControl(object):
         else:
             assert False, "Cannot set to invalid time source: {}".format(time_source)
         with self.regs:
-            reg_val = self.peek32(self.MB_CLOCK_CTRL) & 0xFFFFFF90
-            # prevent glitches by writing a cleared value first, then the final value.
-            self.poke32(self.MB_CLOCK_CTRL, reg_val)
-            reg_val = reg_val | (pps_sel_val & 0x6F)
-            self.log.trace("Writing MB_CLOCK_CTRL to 0x{:08X}".format(reg_val))
+            cleared_val = self.peek32(self.MB_CLOCK_CTRL) & 0xFFFFFF90
+            reg_val = cleared_val | (pps_sel_val & 0x6F)
+            self.log.trace("Writing MB_CLOCK_CTRL to 0x%08X", reg_val)
+            if force_glitchless:
+                # prevent glitches by writing a cleared value first, then the
+                # final value.
+                self.poke32(self.MB_CLOCK_CTRL, cleared_val)
             self.poke32(self.MB_CLOCK_CTRL, reg_val)
 
     def set_clock_source(self, clock_source, ref_clk_freq):
@@ -273,19 +359,18 @@ class MboardRegsControl(object):
         """
         if clock_source == 'internal' or clock_source == 'gpsdo':
             self.log.trace("Setting clock source to internal (GPSDO)"
-                           "({:.1f} MHz reference)...".format(ref_clk_freq))
+                           "(%.1f MHz reference)...", ref_clk_freq)
             ref_sel_val = 0b0
         elif clock_source == 'external':
             self.log.debug("Setting clock source to external..."
-                           "({:.1f} MHz reference)...".format(ref_clk_freq))
+                           "(%.1f MHz reference)...", ref_clk_freq)
             ref_sel_val = 0b1
         else:
             assert False, "Cannot set to invalid clock source: {}".format(clock_source)
-        mask = 0xFFFFFFFF ^ (0b1 << self.MB_CLOCK_CTRL_REF_SEL)
         with self.regs:
-            reg_val = self.peek32(self.MB_CLOCK_CTRL) & mask
+            reg_val = self.peek32(self.MB_CLOCK_CTRL) & self._CLK_REF_SEL_MASK
             reg_val = reg_val | (ref_sel_val << self.MB_CLOCK_CTRL_REF_SEL)
-            self.log.trace("Writing MB_CLOCK_CTRL to 0x{:08X}".format(reg_val))
+            self.log.trace("Writing MB_CLOCK_CTRL to 0x%08X", reg_val)
             self.poke32(self.MB_CLOCK_CTRL, reg_val)
 
     def get_fpga_type(self):
@@ -296,24 +381,20 @@ class MboardRegsControl(object):
         with self.regs:
             sfp_info_rb = self.peek32(self.MB_SFP_PORT_INFO)
         # Print the registers values as 32-bit hex values
-        self.log.trace("SFP Info: 0x{0:0{1}X}".format(sfp_info_rb, 8))
+        self.log.trace("SFP Info: 0x%08X", sfp_info_rb)
         sfp_type = E320_SFP_TYPES.get((sfp_info_rb & 0x0000FF00) >> 8, "")
-        self.log.trace("SFP type: {}".format(sfp_type))
-        try:
-            return E320_FPGA_TYPES_BY_SFP[(sfp_type)]
-        except KeyError:
-            self.log.warning("Unrecognized SFP type: {}"
-                             .format(sfp_type))
-        return ""
+        self.log.trace("SFP type: %s", sfp_type)
+        fpga_type = E320_FPGA_TYPES_BY_SFP.get(sfp_type)
+        if fpga_type is None:
+            self.log.warning("Unrecognized SFP type: %s", sfp_type)
+            return ""
+        return fpga_type
 
     def get_gps_locked_val(self):
         """
         Get GPS LOCK status
         """
-        mask = 0b1 << self.MB_GPS_STATUS_LOCK
-        with self.regs:
-            reg_val = self.peek32(self.MB_GPS_STATUS) & mask
-            gps_locked = reg_val & 0x1 #FIXME
+        gps_locked = self.get_gps_status() & self._GPS_STATUS_LOCK_MASK
         if gps_locked:
             self.log.trace("GPS locked!")
         # Can return this value because the gps_locked value is on the LSB
@@ -321,11 +402,11 @@ class MboardRegsControl(object):
 
     def get_gps_status(self):
         """
-        Get GPS status
+        Get GPS status. Returns all bits of the MB_GPS_STATUS register (lock,
+        alarm, phase lock, survey, warmup) from a single read.
         """
-        mask = 0x1F
         with self.regs:
-            gps_status = self.peek32(self.MB_GPS_STATUS) & mask
+            gps_status = self.peek32(self.MB_GPS_STATUS) & self._GPS_STATUS_MASK
         return gps_status
 
     def enable_gps(self, enable):
@@ -333,27 +414,24 @@ class MboardRegsControl(object):
         Turn power to the GPS (CLK_GPS_PWR_EN) off or on.
         Power signal is GPS_3V3.
         """
-        self.log.trace("{} power to GPS".format(
-            "Enabling" if enable else "Disabling"
-        ))
-        mask = 0xFFFFFFFF ^ (0b1 << self.MB_GPS_CTRL_PWR_EN)
+        self.log.trace("%s power to GPS",
+                       "Enabling" if enable else "Disabling")
         with self.regs:
-            reg_val = self.peek32(self.MB_GPS_CTRL) & mask
+            reg_val = self.peek32(self.MB_GPS_CTRL) & self._GPS_CTRL_PWR_EN_MASK
             reg_val = reg_val | (enable << self.MB_GPS_CTRL_PWR_EN)
-            self.log.trace("Writing MB_GPS_CTRL to 0x{:08X}".format(reg_val))
+            self.log.trace("Writing MB_GPS_CTRL to 0x%08X", reg_val)
             return self.poke32(self.MB_GPS_CTRL, reg_val)
 
     def get_refclk_lock(self):
         """
         Check the status of the reference clock (adf4002) in FPGA.
         """
-        mask = 0b1 << self.MB_CLOCK_CTRL_REF_CLK_LOCKED
         with self.regs:
             reg_val = self.peek32(self.MB_CLOCK_CTRL)
-        locked = (reg_val & mask) > 0
+        locked = (reg_val & self._REF_CLK_LOCKED_MASK) > 0
         if not locked:
             self.log.warning("Reference Clock reporting unlocked. "
-                             "MB_CLOCK_CTRL reg: 0x{:08X}".format(reg_val))
+                             "MB_CLOCK_CTRL reg: 0x%08X", reg_val)
         else:
             self.log.trace("Reference Clock locked!")
         return locked
@@ -368,7 +446,8 @@ class MboardRegsControl(object):
             reg_val = self.peek32(self.MB_DBOARD_CTRL)
             if channel_mode == "MIMO":
                 reg_val = (0b1 << self.MB_DBOARD_CTRL_MIMO)
-                self.log.trace("Setting channel mode in AD9361 interface: {}".format("2R2T" if channel_mode == 2 else "1R1T"))
+                self.log.trace("Setting channel mode in AD9361 interface: %s",
+                               "2R2T" if channel_mode == 2 else "1R1T")
             else:
                 # Warn if user tries to set either tx0/tx1 in mimo mode
                 # as both will be set automatically
@@ -380,17 +459,25 @@ class MboardRegsControl(object):
                     # in SISO mode, Channel 0
                     reg_val = (0b0 << self.MB_DBOARD_CTRL_TX_CHAN_SEL) | (0b0 << self.MB_DBOARD_CTRL_MIMO)
                     self.log.trace("Setting TX channel in AD9361 interface to: TX0")
-            self.log.trace("Writing MB_DBOARD_CTRL to 0x{:08X}".format(reg_val))
+            self.log.trace("Writing MB_DBOARD_CTRL to 0x%08X", reg_val)
             self.poke32(self.MB_DBOARD_CTRL, reg_val)
 
+    def get_ad9361_lo_locks(self):
+        """
+        Check the status of the TX and RX LO lock from CTRL_OUT pins from
+        Catalina with a single register read.
+        Returns a tuple (tx_locked, rx_locked).
+        """
+        with self.regs:
+            reg_val = self.peek32(self.MB_DBOARD_STATUS)
+        return ((reg_val & self._DBOARD_STATUS_TX_LOCK_MASK) > 0,
+                (reg_val & self._DBOARD_STATUS_RX_LOCK_MASK) > 0)
+
     def get_ad9361_tx_lo_lock(self):
         """
         Check the status of TX LO lock from CTRL_OUT pins from Catalina
         """
-        mask = 0b1 << self.MB_DBOARD_STATUS_TX_LOCK
-        with self.regs:
-            reg_val =  self.peek32(self.MB_DBOARD_STATUS)
-        locked = (reg_val & mask) > 0
+        locked = self.get_ad9361_lo_locks()[0]
         if not locked:
             self.log.warning("TX RF PLL reporting unlocked. ")
         else:
@@ -401,10 +488,7 @@ class MboardRegsControl(object):
         """
         Check the status of RX LO lock from CTRL_OUT pins from Catalina
         """
-        mask = 0b1 << self.MB_DBOARD_STATUS_RX_LOCK
-        with self.regs:
-            reg_val =  self.peek32(self.MB_DBOARD_STATUS)
-        locked = (reg_val & mask) > 0
+        locked = self.get_ad9361_lo_locks()[1]
         if not locked:
             self.log.warning("RX RF PLL reporting unlocked. ")
         else:
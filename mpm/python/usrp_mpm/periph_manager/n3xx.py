@@ -7,12 +7,12 @@
 N3xx implementation module
 """
 
-from __future__ import print_function
-import copy
+import os
 import re
 import threading
 import time
-from six import iteritems, itervalues
+from concurrent import futures
+from types import MappingProxyType
 from usrp_mpm.cores import WhiteRabbitRegsControl
 from usrp_mpm.components import ZynqComponents
 from usrp_mpm.gpsd_iface import GPSDIfaceExtension
@@ -23,6 +23,7 @@ from usrp_mpm.rpc_server import no_rpc
 from usrp_mpm.sys_utils import dtoverlay
 from usrp_mpm.sys_utils import i2c_dev
 from usrp_mpm.sys_utils.sysfs_thermal import read_thermal_sensor_value
+from usrp_mpm.sys_utils.sysfs_thermal import get_thermal_sensor_path
 from usrp_mpm.xports import XportMgrUDP, XportMgrLiberio
 from usrp_mpm.periph_manager.n3xx_periphs import TCA6424
 from usrp_mpm.periph_manager.n3xx_periphs import BackpanelGPIO
@@ -33,6 +34,7 @@ from usrp_mpm.dboard_manager.eiscat import EISCAT
 from usrp_mpm.dboard_manager.rhodium import Rhodium
 
 N3XX_DEFAULT_EXT_CLOCK_FREQ = 10e6
+N3XX_EXT_CLOCK_FREQS = frozenset((10e6, 20e6, 25e6))
 N3XX_DEFAULT_CLOCK_SOURCE = 'internal'
 N3XX_DEFAULT_TIME_SOURCE = 'internal'
 N3XX_DEFAULT_ENABLE_GPS = True
@@ -43,6 +45,48 @@ N32X_DEFAULT_QSFP_DRIVER_PRESET = 'Optical'
 N32X_QSFP_I2C_LABEL = 'qsfp-i2c'
 N3XX_FPGA_COMPAT = (5, 3)
 N3XX_MONITOR_THREAD_INTERVAL = 1.0 # seconds
+# The status monitor thread refreshes the thermal sensor values once per
+# interval, so sensor queries can be served from the cache if the values
+# are not older than this.
+N3XX_THERMAL_CACHE_TIME = 1.5 * N3XX_MONITOR_THREAD_INTERVAL # seconds
+# Port expander pin settings to select a reference clock source. For every
+# clock source, this is a sequence of (pin name, value) which are written in
+# order.
+N3XX_CLOCK_SOURCE_GPIOS = {
+    'internal': (
+        ('CLK-MAINSEL-EX_B', 1),
+        ('CLK-MAINSEL-25MHz', 1),
+        ('CLK-MAINSEL-GPS', 0),
+    ),
+    'gpsdo': (
+        ('CLK-MAINSEL-EX_B', 1),
+        ('CLK-MAINSEL-25MHz', 0),
+        ('CLK-MAINSEL-GPS', 1),
+    ),
+    'external': (
+        ('CLK-MAINSEL-EX_B', 0),
+        ('CLK-MAINSEL-GPS', 0),
+        # SKY13350 needs to be in known state
+        ('CLK-MAINSEL-25MHz', 1),
+    ),
+}
+# If the requested clock/time source combination is not valid, this is the
+# time source we pick for a given clock source...
+N3XX_CLOCK_TO_TIME_FALLBACK = {
+    'internal': 'internal',
+    'external': 'external',
+    'gpsdo': 'gpsdo',
+}
+# ...and this is the clock source we pick for a given time source.
+N3XX_TIME_TO_CLOCK_FALLBACK = {
+    'sfp0': 'internal',
+    'internal': 'internal',
+    'external': 'external',
+    'gpsdo': 'gpsdo',
+}
+
+# Extracts the sensor name from a sensor getter method name
+N3XX_SENSOR_NAME_RE = re.compile(r"get_(.+?)_sensor$")
 
 # Import daughterboard PIDs from their respective classes
 MG_PID = Magnesium.pids[0]
@@ -55,39 +99,41 @@ RHODIUM_PID = Rhodium.pids[0]
 class N3xxXportMgrUDP(XportMgrUDP):
     " N3xx-specific UDP configuration "
     xbar_dev = "/dev/crossbar0"
-    iface_config = {
-        'bridge0': {
+    # The interface configuration is shared by all instances, so make it
+    # read-only.
+    iface_config = MappingProxyType({
+        'bridge0': MappingProxyType({
             'label': 'misc-enet-regs0',
             'xbar': 0,
             'xbar_port': 0,
             'ctrl_src_addr': 0,
-        },
-        'sfp0': {
+        }),
+        'sfp0': MappingProxyType({
             'label': 'misc-enet-regs0',
             'xbar': 0,
             'xbar_port': 0,
             'ctrl_src_addr': 0,
-        },
-        'sfp1': {
+        }),
+        'sfp1': MappingProxyType({
             'label': 'misc-enet-regs1',
             'xbar': 0,
             'xbar_port': 1,
             'ctrl_src_addr': 1,
-        },
-        'eth1': {
+        }),
+        'eth1': MappingProxyType({
             'label': 'misc-enet-regs0',
             'xbar': 0,
             'xbar_port': 0,
             'ctrl_src_addr': 0,
-        },
-        'eth2': {
+        }),
+        'eth2': MappingProxyType({
             'label': 'misc-enet-regs1',
             'xbar': 0,
             'xbar_port': 1,
             'ctrl_src_addr': 1,
-        },
-    }
-    bridges = {'bridge0': ['sfp0', 'sfp1', 'bridge0']}
+        }),
+    })
+    bridges = MappingProxyType({'bridge0': ('sfp0', 'sfp1', 'bridge0')})
 
 class N3xxXportMgrLiberio(XportMgrLiberio):
     " N3xx-specific Liberio configuration "
@@ -95,6 +141,18 @@ class N3xxXportMgrLiberio(XportMgrLiberio):
     xbar_dev = "/dev/crossbar0"
     xbar_port = 2
 
+def _expand_product_rules(product_rules):
+    """
+    Turn a list of product rules into a product map. See n3xx._product_rules
+    for the format of the rules.
+    """
+    product_map = {}
+    for mb_product, db_pids, product, slot_b_optional in product_rules:
+        product_map[(mb_product, db_pids)] = product
+        if slot_b_optional and len(db_pids) > 1:
+            product_map[(mb_product, db_pids[:1])] = product
+    return product_map
+
 ###############################################################################
 # Main Class
 ###############################################################################
@@ -102,23 +160,32 @@ class n3xx(ZynqComponents, PeriphManagerBase):
     """
     Holds N3xx specific attributes and methods
     """
-    # For every variant of the N3xx, add a line to the product map. If
+    # For every variant of the N3xx, add a line to the product rules. If
     # it uses a new daughterboard, also import that PID from the dboard
-    # manager class. The format of this map is:
+    # manager class. The format of every rule is:
+    # (motherboard product code, (Slot-A DB PID, [Slot-B DB PID]), product,
+    #  also valid with Slot B empty?)
+    _product_rules = (
+        ('n300', tuple(), 'n300', False),
+        ('n300', (MG_PID,), 'n300', False), # Slot B is empty
+        ('n310', tuple(), 'n310', False),
+        # If Slot B is empty, we can still use the n310.bin image. We'll
+        # leave this here for debugging purposes.
+        ('n310', (MG_PID, MG_PID), 'n310', True),
+        ('n310', (EISCAT_PID, EISCAT_PID), 'eiscat', False),
+        ('n310', (RHODIUM_PID, RHODIUM_PID), 'n320', True),
+    )
+    # The expanded product rules:
     # (motherboard product code, (Slot-A DB PID, [Slot-B DB PID])) -> product
-    product_map = {
-        ('n300', tuple()) : 'n300',
-        ('n300', (MG_PID,       )): 'n300', # Slot B is empty
-        ('n310', tuple()) : 'n310',
-        ('n310', (MG_PID, MG_PID)): 'n310',
-        ('n310', (MG_PID,       )): 'n310', # If Slot B is empty, we can
-                                            # still use the n310.bin image.
-                                            # We'll leave this here for
-                                            # debugging purposes.
-        ('n310', (EISCAT_PID , EISCAT_PID )): 'eiscat',
-        ('n310', (RHODIUM_PID, RHODIUM_PID)): 'n320',
-        ('n310', (RHODIUM_PID,            )): 'n320',
+    product_map = _expand_product_rules(_product_rules)
+    # Same as product_map, but with the dboard PIDs sorted, so the lookup
+    # doesn't depend on the slot order. Use this one for lookups.
+    _canonical_product_map = {
+        (mb_product, tuple(sorted(db_pids))): product
+        for (mb_product, db_pids), product in product_map.items()
     }
+    # All valid product names, for quick sanity checks
+    _product_names = frozenset(product_map.values())
 
     #########################################################################
     # Overridables
@@ -168,14 +235,51 @@ class n3xx(ZynqComponents, PeriphManagerBase):
     #########################################################################
     # Others properties
     #########################################################################
-     # All valid sync_sources for N3xx in the form of (clock_source, time_source)
-    valid_sync_sources = {
+    # All valid clock and time sources for N3xx, in the order they're listed
+    # by get_clock_sources() and get_time_sources()
+    _clock_sources = ('external', 'internal', 'gpsdo')
+    _time_sources = ('internal', 'external', 'gpsdo', 'sfp0')
+    # Same, for validating sources
+    _clock_source_set = frozenset(_clock_sources)
+    _time_source_set = frozenset(_time_sources)
+    # All valid sync_sources for N3xx in the form of (clock_source, time_source)
+    valid_sync_sources = frozenset((
         ('internal', 'internal'),
         ('internal', 'sfp0'),
         ('external', 'external'),
         ('external', 'internal'),
         ('gpsdo', 'gpsdo'),
+    ))
+    # The boolean sensors can only ever return one of two values, so they are
+    # only created once. Return copies, though.
+    _REF_LOCKED_SENSOR = {
+        'name': 'ref_locked',
+        'type': 'BOOLEAN',
+        'unit': 'locked',
+        'value': 'true',
+    }
+    _REF_UNLOCKED_SENSOR = dict(
+        _REF_LOCKED_SENSOR, unit='unlocked', value='false')
+    _GPS_LOCKED_SENSOR = {
+        'name': 'gps_lock',
+        'type': 'BOOLEAN',
+        'unit': 'locked',
+        'value': 'true',
+    }
+    _GPS_UNLOCKED_SENSOR = dict(
+        _GPS_LOCKED_SENSOR, unit='unlocked', value='false')
+    # For the other sensors, only the value changes
+    _TEMP_SENSOR = {
+        'name': 'temperature',
+        'type': 'REALNUM',
+        'unit': 'C',
     }
+    _FAN_SENSOR = {
+        'name': 'cooling fan',
+        'type': 'INTEGER',
+        'unit': 'rpm',
+    }
+
     @classmethod
     def generate_device_info(cls, eeprom_md, mboard_info, dboard_infos):
         """
@@ -188,9 +292,10 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         mb_pid = eeprom_md.get('pid')
         lookup_key = (
             n3xx.pids.get(mb_pid, 'unknown'),
-            tuple([x['pid'] for x in dboard_infos]),
+            tuple(sorted(x['pid'] for x in dboard_infos)),
         )
-        device_info['product'] = cls.product_map.get(lookup_key, 'unknown')
+        device_info['product'] = \
+            cls._canonical_product_map.get(lookup_key, 'unknown')
         return device_info
 
     @staticmethod
@@ -211,14 +316,31 @@ class n3xx(ZynqComponents, PeriphManagerBase):
     # Ctor and device initialization tasks
     ###########################################################################
     def __init__(self, args):
-        self._tear_down = False
+        self._tear_down_event = threading.Event()
         self._status_monitor_thread = None
         self._ext_clock_freq = None
         self._clock_source = None
+        self._ref_clock_freq = None
         self._time_source = None
-        self._available_endpoints = list(range(256))
+        self._available_endpoints = set(range(256))
         self._bp_leds = None
         self._gpsd = None
+        self._fpga_info = None
+        self._wr_regs_control = None
+        self._safe_state_dboards = []
+        self._ref_lock_getters = []
+        self._thermal_values = ('-1', '-1')
+        self._thermal_timestamp = None
+        self._temp_fd = None
+        self._fan_fd = None
+        # Protects the thermal sensor fds and cache. The fds may only be
+        # closed while nobody is reading from them, otherwise a reused fd
+        # number could make us read an unrelated file.
+        self._thermal_lock = threading.Lock()
+        # Thermal sensors whose last read failed. Repeated failures of the
+        # same sensor are only logged at debug level.
+        self._thermal_read_errors = set()
+        self._db_eeprom_cache = {}
         super(n3xx, self).__init__(args)
         if not self._device_initialized:
             # Don't try and figure out what's going on. Just give up.
@@ -243,7 +365,7 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         ))
         assert_compat_number(
             N3XX_FPGA_COMPAT,
-            self.mboard_regs_control.get_compat_number(),
+            actual_compat,
             component="FPGA",
             fail_on_old_minor=True,
             log=self.log
@@ -257,6 +379,7 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         self._ext_clock_freq = float(
             default_args.get('ext_clock_freq', N3XX_DEFAULT_EXT_CLOCK_FREQ)
         )
+        self._update_ref_clock_freq()
         if len(self.dboards) == 0:
             self.log.warning(
                 "No dboards found, skipping setting clock and time source " \
@@ -264,6 +387,7 @@ class n3xx(ZynqComponents, PeriphManagerBase):
             )
             self._clock_source = N3XX_DEFAULT_CLOCK_SOURCE
             self._time_source = N3XX_DEFAULT_TIME_SOURCE
+            self._update_ref_clock_freq()
         else:
             self.set_sync_source({
                 'clock_source': default_args.get('clock_source',
@@ -289,21 +413,43 @@ class n3xx(ZynqComponents, PeriphManagerBase):
 
         - GPS lock (update back-panel GPS LED)
         - REF lock (update back-panel REF LED)
+        - FPGA temperature and fan speed (refresh the thermal sensor cache)
         """
         self.log.trace("Launching monitor loop...")
-        cond = threading.Condition()
-        cond.acquire()
-        while not self._tear_down:
-            gps_locked = bool(self._gpios.get("GPS-LOCKOK"))
-            self._bp_leds.set(self._bp_leds.LED_GPS, int(gps_locked))
-            ref_locked = self.get_ref_lock_sensor()['value'] == 'true'
-            self._bp_leds.set(self._bp_leds.LED_REF, int(ref_locked))
-            # Now wait
-            if cond.wait_for(
-                    lambda: self._tear_down,
-                    N3XX_MONITOR_THREAD_INTERVAL):
+        # This loop runs for the lifetime of the daemon, so hoist the lookups
+        tear_down_event = self._tear_down_event
+        get_gpio = self._gpios.get
+        get_ref_lock_sensor = self.get_ref_lock_sensor
+        read_thermal_values = self._read_thermal_values
+        set_led = self._bp_leds.set
+        led_gps = self._bp_leds.LED_GPS
+        led_ref = self._bp_leds.LED_REF
+        # Only touch the LEDs when their state actually changes
+        prev_gps_locked = None
+        prev_ref_locked = None
+        thermal_error_logged = False
+        while not tear_down_event.is_set():
+            gps_locked = bool(get_gpio("GPS-LOCKOK"))
+            if gps_locked != prev_gps_locked:
+                set_led(led_gps, int(gps_locked))
+                prev_gps_locked = gps_locked
+            ref_locked = get_ref_lock_sensor()['value'] == 'true'
+            if ref_locked != prev_ref_locked:
+                set_led(led_ref, int(ref_locked))
+                prev_ref_locked = ref_locked
+            # Keep the thermal sensor cache warm, so sensor queries from
+            # clients don't have to wait for the thermal subsystem. A failure
+            # here must not stop the LED updates.
+            try:
+                read_thermal_values(max_age=0)
+            except Exception as ex:
+                if not thermal_error_logged:
+                    self.log.warning(
+                        "Failed to refresh thermal sensors: %s", str(ex))
+                    thermal_error_logged = True
+            # Now wait. tear_down() sets the event, which wakes us up early.
+            if tear_down_event.wait(N3XX_MONITOR_THREAD_INTERVAL):
                 break
-        cond.release()
         self.log.trace("Terminating monitor loop.")
 
     def _init_peripherals(self, args):
@@ -315,47 +461,88 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         likely.
         """
         # Sanity checks
-        assert self.device_info.get('product') in self.product_map.values(), \
+        assert self.device_info.get('product') in self._product_names, \
                 "Device product could not be determined!"
-        # Init peripherals
-        self.log.trace("Initializing TCA6424 port expander controls...")
-        self._gpios = TCA6424(int(self.mboard_info['rev']))
-        self.log.trace("Initializing back panel LED controls...")
-        self._bp_leds = BackpanelGPIO()
-        self.log.trace("Enabling power of MGT156MHZ clk")
-        self._gpios.set("PWREN-CLK-MGT156MHz")
-        self.enable_1g_ref_clock()
-        self.enable_wr_ref_clock()
-        self.enable_gps(
-            enable=str2bool(
-                args.get('enable_gps', N3XX_DEFAULT_ENABLE_GPS)
+        # Not all dboards can be put into a safe clocking state, so find out
+        # once which can, rather than on every clock source change.
+        self._safe_state_dboards = [
+            (slot, dboard)
+            for slot, dboard in enumerate(self.dboards)
+            if hasattr(dboard, 'set_clk_safe_state')
+        ]
+        # Same for the ref lock status, which the status monitor reads once
+        # a second
+        self._ref_lock_getters = [
+            dboard.get_ref_lock
+            for dboard in self.dboards
+            if hasattr(dboard, 'get_ref_lock')
+        ]
+        # Connecting to GPSd and looking for the QSFP board don't depend on
+        # anything else we do here, so get them going in the background.
+        executor = futures.ThreadPoolExecutor(max_workers=2)
+        gpsd_future = executor.submit(GPSDIfaceExtension)
+        qsfp_i2c_future = executor.submit(
+            i2c_dev.of_get_i2c_adapter, N32X_QSFP_I2C_LABEL)
+        try:
+            # Init peripherals
+            self.log.trace("Initializing TCA6424 port expander controls...")
+            self._gpios = TCA6424(int(self.mboard_info['rev']))
+            self.log.trace("Initializing back panel LED controls...")
+            self._bp_leds = BackpanelGPIO()
+            with self._gpios.batch():
+                self.log.trace("Enabling power of MGT156MHZ clk")
+                self._gpios.set("PWREN-CLK-MGT156MHz")
+                self.enable_1g_ref_clock()
+                self.enable_wr_ref_clock()
+            self.enable_gps(
+                enable=str2bool(
+                    args.get('enable_gps', N3XX_DEFAULT_ENABLE_GPS)
+                )
             )
-        )
-        self.enable_fp_gpio(
-            enable=str2bool(
-                args.get(
-                    'enable_fp_gpio',
-                    N3XX_DEFAULT_ENABLE_FPGPIO
+            self.enable_fp_gpio(
+                enable=str2bool(
+                    args.get(
+                        'enable_fp_gpio',
+                        N3XX_DEFAULT_ENABLE_FPGPIO
+                    )
                 )
             )
-        )
-        # Init Mboard Regs
-        self.mboard_regs_control = MboardRegsControl(
-            self.mboard_regs_label, self.log)
-        self.mboard_regs_control.get_git_hash()
-        self.mboard_regs_control.get_build_timestamp()
-        self._check_fpga_compat()
-        self._update_fpga_type()
-        self.crossbar_base_port = self.mboard_regs_control.get_xbar_baseport()
-        # Init clocking
-        self.enable_ref_clock(enable=True)
-        self._ext_clock_freq = None
-        self._init_ref_clock_and_time(args)
-        self._init_meas_clock()
-        # Init GPSd iface and GPS sensors
-        self._init_gps_sensors()
+            # Init Mboard Regs
+            self.mboard_regs_control = MboardRegsControl(
+                self.mboard_regs_label, self.log)
+            self.mboard_regs_control.get_git_hash()
+            self.mboard_regs_control.get_build_timestamp()
+            self._check_fpga_compat()
+            self._update_fpga_type()
+            self.crossbar_base_port = self.mboard_regs_control.get_xbar_baseport()
+            # Init clocking
+            self.enable_ref_clock(enable=True)
+            self._ext_clock_freq = None
+            self._init_ref_clock_and_time(args)
+            self._init_meas_clock()
+            self.log.trace("Initializing GPSd interface")
+            gpsd = gpsd_future.result()
+            qsfp_i2c = qsfp_i2c_future.result()
+        except BaseException:
+            # Don't leave a connection to GPSd dangling if we fail
+            for future in (gpsd_future, qsfp_i2c_future):
+                future.cancel()
+            futures.wait((gpsd_future,))
+            if not gpsd_future.cancelled() and gpsd_future.exception() is None:
+                gpsd_future.result().close()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+        # Keep the thermal sensor files open, so we don't have to look them up
+        # every time we read them
+        self._close_thermal_sensors()
+        with self._thermal_lock:
+            self._temp_fd = \
+                self._open_thermal_sensor('fpga-thermal-zone', 'temp')
+            self._fan_fd = self._open_thermal_sensor('ec-fan0', 'cur_state')
+        # Init GPS sensors
+        self._init_gps_sensors(gpsd)
         # Init QSFP board (if available)
-        qsfp_i2c = i2c_dev.of_get_i2c_adapter(N32X_QSFP_I2C_LABEL)
         if qsfp_i2c:
             self.log.debug("Creating QSFP Retimer control object...")
             self._qsfp_retimer = RetimerQSFP(qsfp_i2c)
@@ -380,23 +567,60 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         )
         self._status_monitor_thread.start()
         # Init complete.
-        self.log.debug("Device info: {}".format(self.device_info))
+        self.log.debug("Device info: %s", self.device_info)
+
+    def _open_thermal_sensor(self, sensor_type, data_probe):
+        """
+        Open the sysfs file of a thermal sensor for reading and return its
+        file descriptor, or None if that doesn't work. In that case, we fall
+        back to looking up the sensor on every read.
+        """
+        sensor_path = get_thermal_sensor_path(sensor_type, data_probe)
+        if sensor_path is None:
+            return None
+        try:
+            return os.open(sensor_path, os.O_RDONLY)
+        except OSError as ex:
+            self.log.debug("Can't open %s: %s", sensor_path, str(ex))
+            return None
+
+    def _close_thermal_sensors(self):
+        """
+        Close the thermal sensor files opened by _open_thermal_sensor(), if
+        any. Reads fall back to looking up the sensor afterwards.
+        """
+        with self._thermal_lock:
+            for thermal_fd in (self._temp_fd, self._fan_fd):
+                if thermal_fd is not None:
+                    os.close(thermal_fd)
+            self._temp_fd = None
+            self._fan_fd = None
 
-    def _init_gps_sensors(self):
-        "Init and register the GPSd Iface and related sensor functions"
-        self.log.trace("Initializing GPSd interface")
-        self._gpsd = GPSDIfaceExtension()
+    @staticmethod
+    def _read_thermal_sensor(fd, sensor_type, data_probe):
+        """
+        Read an integer thermal sensor value, from the already open file fd
+        if possible.
+        """
+        if fd is None:
+            return read_thermal_sensor_value(sensor_type, data_probe)
+        # sysfs attributes are regenerated on every read from offset 0
+        return int(os.pread(fd, 32, 0))
+
+    def _init_gps_sensors(self, gpsd):
+        "Register the GPSd Iface and related sensor functions"
+        self._gpsd = gpsd
         new_methods = self._gpsd.extend(self)
         for method_name in new_methods:
-            try:
-                # Extract the sensor name from the getter
-                sensor_name = re.search(r"get_(.*)_sensor", method_name).group(1)
-                # Register it with the MB sensor framework
-                self.mboard_sensor_callback_map[sensor_name] = method_name
-                self.log.trace("Adding %s sensor function", sensor_name)
-            except AttributeError:
-                # re.search will return None is if can't find the sensor name
+            # Extract the sensor name from the getter
+            sensor_name_match = N3XX_SENSOR_NAME_RE.match(method_name)
+            if sensor_name_match is None:
                 self.log.warning("Error while registering sensor function: %s", method_name)
+                continue
+            sensor_name = sensor_name_match.group(1)
+            # Register it with the MB sensor framework
+            self.mboard_sensor_callback_map[sensor_name] = method_name
+            self.log.trace("Adding %s sensor function", sensor_name)
 
     ###########################################################################
     # Session init and deinit
@@ -440,7 +664,7 @@ class n3xx(ZynqComponents, PeriphManagerBase):
             'pps_export',
             N3XX_DEFAULT_ENABLE_PPS_EXPORT
         ))
-        for xport_mgr in itervalues(self._xport_mgrs):
+        for xport_mgr in self._xport_mgrs.values():
             xport_mgr.init(args)
         return result
 
@@ -453,10 +677,10 @@ class n3xx(ZynqComponents, PeriphManagerBase):
                 "Cannot run deinit(), device was never fully initialized!")
             return
         super(n3xx, self).deinit()
-        for xport_mgr in itervalues(self._xport_mgrs):
+        for xport_mgr in self._xport_mgrs.values():
             xport_mgr.deinit()
         self.log.trace("Resetting SID pool...")
-        self._available_endpoints = list(range(256))
+        self._available_endpoints = set(range(256))
 
     def tear_down(self):
         """
@@ -465,16 +689,16 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         For N3xx, this means the overlay.
         """
         self.log.trace("Tearing down N3xx device...")
-        self._tear_down = True
+        self._tear_down_event.set()
         if self._device_initialized:
             self._status_monitor_thread.join(3 * N3XX_MONITOR_THREAD_INTERVAL)
             if self._status_monitor_thread.is_alive():
                 self.log.error("Could not terminate monitor thread! "
                                "This could result in resource leaks.")
+        self._close_thermal_sensors()
         active_overlays = self.list_active_overlays()
-        self.log.trace("N3xx has active device tree overlays: {}".format(
-            active_overlays
-        ))
+        self.log.trace("N3xx has active device tree overlays: %s",
+                       active_overlays)
         for overlay in active_overlays:
             dtoverlay.rm_overlay(overlay)
 
@@ -490,14 +714,15 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         """
         See PeriphManagerBase.request_xport() for docs.
         """
-        # Try suggested address first, then just pick the first available one:
+        # Try suggested address first, then just pick the first (lowest)
+        # available one:
         src_address = suggested_src_address
         if src_address not in self._available_endpoints:
             if len(self._available_endpoints) == 0:
                 raise RuntimeError(
                     "Depleted pool of SID endpoints for this device!")
             else:
-                src_address = self._available_endpoints[0]
+                src_address = min(self._available_endpoints)
         sid = SID(src_address << 16 | dst_address)
         # Note: This SID may change its source address!
         self.log.trace(
@@ -546,14 +771,19 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         """
         if not self._device_initialized:
             return {}
+        # The FPGA info is fixed for a given bitstream, only the IP addresses
+        # can change at runtime.
+        if self._fpga_info is None:
+            self._fpga_info = {
+                'fpga_version': "{}.{}".format(
+                    *self.mboard_regs_control.get_compat_number()),
+                'fpga_version_hash': "{:x}.{}".format(
+                    *self.mboard_regs_control.get_git_hash()),
+                'fpga': self.updateable_components.get('fpga', {}).get(
+                    'type', ""),
+            }
         device_info = self._xport_mgrs['udp'].get_xport_info()
-        device_info.update({
-            'fpga_version': "{}.{}".format(
-                *self.mboard_regs_control.get_compat_number()),
-            'fpga_version_hash': "{:x}.{}".format(
-                *self.mboard_regs_control.get_git_hash()),
-            'fpga': self.updateable_components.get('fpga', {}).get('type', ""),
-        })
+        device_info.update(self._fpga_info)
         return device_info
 
     ###########################################################################
@@ -562,7 +792,7 @@ class n3xx(ZynqComponents, PeriphManagerBase):
     def get_clock_sources(self):
         " Lists all available clock sources. "
         self.log.trace("Listing available clock sources...")
-        return ('external', 'internal', 'gpsdo')
+        return self._clock_sources
 
     def get_clock_source(self):
         " Returns the currently selected clock source "
@@ -575,12 +805,8 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         assert clock_source is not None
         assert time_source is not None
         if (clock_source, time_source) not in self.valid_sync_sources:
-            if clock_source == 'internal':
-                time_source = 'internal'
-            elif clock_source == 'external':
-                time_source = 'external'
-            elif clock_source == 'gpsdo':
-                time_source = 'gpsdo'
+            time_source = N3XX_CLOCK_TO_TIME_FALLBACK.get(
+                clock_source, time_source)
         source = {"clock_source": clock_source,
                   "time_source": time_source
                  }
@@ -588,7 +814,7 @@ class n3xx(ZynqComponents, PeriphManagerBase):
 
     def get_time_sources(self):
         " Returns list of valid time sources "
-        return ['internal', 'external', 'gpsdo', 'sfp0']
+        return list(self._time_sources)
 
     def get_time_source(self):
         " Return the currently selected time source "
@@ -600,14 +826,8 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         assert clock_source != None
         assert time_source != None
         if (clock_source, time_source) not in self.valid_sync_sources:
-            if time_source == 'sfp0':
-                clock_source = 'internal'
-            elif time_source == 'internal':
-                clock_source = 'internal'
-            elif time_source == 'external':
-                clock_source = 'external'
-            elif time_source == 'gpsdo':
-                clock_source = 'gpsdo'
+            clock_source = N3XX_TIME_TO_CLOCK_FALLBACK.get(
+                time_source, clock_source)
         source = {"time_source": time_source,
                   "clock_source": clock_source
                  }
@@ -620,52 +840,46 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         """
 
         clock_source = args.get('clock_source', self._clock_source)
-        assert clock_source in self.get_clock_sources()
         time_source = args.get('time_source', self._time_source)
-        assert time_source in self.get_time_sources()
         if (clock_source == self._clock_source) and (time_source == self._time_source):
             # Nothing change no need to do anything
             self.log.trace("New sync source assignment matches"
                            "previous assignment. Ignoring update command.")
             return
+        assert clock_source in self._clock_source_set
+        assert time_source in self._time_source_set
         assert (clock_source, time_source) in self.valid_sync_sources
         # Start setting sync source
-        self.log.debug("Setting clock source to `{}'".format(clock_source))
+        self.log.debug("Setting clock source to `%s'", clock_source)
         # Place the DB clocks in a safe state to allow reference clock
         # transitions. This leaves all the DB clocks OFF.
-        for slot, dboard in enumerate(self.dboards):
-            if hasattr(dboard, 'set_clk_safe_state'):
-                self.log.trace(
-                    "Setting dboard %d components to safe clocking state...", slot)
-                dboard.set_clk_safe_state()
+        for slot, dboard in self._safe_state_dboards:
+            self.log.trace(
+                "Setting dboard %d components to safe clocking state...", slot)
+            dboard.set_clk_safe_state()
         # Disable the Ref Clock in the FPGA before throwing the external switches.
         self.mboard_regs_control.enable_ref_clk(False)
         # Set the external switches to bring in the new source.
-        if clock_source == 'internal':
-            self._gpios.set("CLK-MAINSEL-EX_B")
-            self._gpios.set("CLK-MAINSEL-25MHz")
-            self._gpios.reset("CLK-MAINSEL-GPS")
-        elif clock_source == 'gpsdo':
-            self._gpios.set("CLK-MAINSEL-EX_B")
-            self._gpios.reset("CLK-MAINSEL-25MHz")
-            self._gpios.set("CLK-MAINSEL-GPS")
-        else: # external
-            self._gpios.reset("CLK-MAINSEL-EX_B")
-            self._gpios.reset("CLK-MAINSEL-GPS")
-            # SKY13350 needs to be in known state
-            self._gpios.set("CLK-MAINSEL-25MHz")
-        self._clock_source = clock_source
-        self.log.debug("Reference clock source is: {}" \
-                       .format(self._clock_source))
-        self.log.debug("Reference clock frequency is: {} MHz" \
-                       .format(self.get_ref_clock_freq()/1e6))
+        gpio_set = self._gpios.set
+        with self._gpios.batch():
+            for pin_name, value in N3XX_CLOCK_SOURCE_GPIOS[clock_source]:
+                gpio_set(pin_name, value)
         # Enable the Ref Clock in the FPGA after giving it a chance to
-        # settle. The settling time is a guess.
-        time.sleep(0.100)
+        # settle. The settling time is a guess. Whatever bookkeeping we do
+        # in the meantime counts towards the settling time.
+        settle_deadline = time.monotonic() + 0.100
+        self._clock_source = clock_source
+        self._update_ref_clock_freq()
+        ref_clk_freq = self._ref_clock_freq
+        self.log.debug("Reference clock source is: %s", self._clock_source)
+        self.log.debug("Reference clock frequency is: %s MHz",
+                       ref_clk_freq/1e6)
+        settle_remaining = settle_deadline - time.monotonic()
+        if settle_remaining > 0:
+            time.sleep(settle_remaining)
         self.mboard_regs_control.enable_ref_clk(True)
-        self.log.debug("Setting time source to `{}'".format(time_source))
+        self.log.debug("Setting time source to `%s'", time_source)
         self._time_source = time_source
-        ref_clk_freq = self.get_ref_clock_freq()
         self.mboard_regs_control.set_time_source(time_source, ref_clk_freq)
         if time_source == 'sfp0':
             # This error is specific to slave and master mode for White Rabbit.
@@ -684,16 +898,19 @@ class n3xx(ZynqComponents, PeriphManagerBase):
                 raise RuntimeError("{} time source requires FPGA types {}" \
                                .format(time_source, sfp_time_source_images))
             # Only open UIO to the WR core once we're guaranteed it exists.
-            wr_regs_control = WhiteRabbitRegsControl(
-                self.wr_regs_label, self.log)
+            if self._wr_regs_control is None:
+                self._wr_regs_control = WhiteRabbitRegsControl(
+                    self.wr_regs_label, self.log)
+            wr_regs_control = self._wr_regs_control
             # Wait for time source to become ready. Only applies to SFP0/1. All other
             # targets start their PPS immediately.
-            self.log.debug("Waiting for {} timebase to lock..." \
-                           .format(time_source))
+            self.log.debug("Waiting for %s timebase to lock...", time_source)
             if not poll_with_timeout(
                     lambda: wr_regs_control.get_time_lock_status(),
                     40000, # Try for x ms... this number is set from a few benchtop tests
-                    1000, # Poll every... second! why not?
+                    10, # Start polling every 10 ms to catch a quick lock...
+                    max_interval_ms=500, # ...then back off to twice a second
+                    backoff=2.0,
                 ):
                 self.log.error("{} timebase failed to lock within 40 seconds. Status: 0x{:X}" \
                                .format(time_source, wr_regs_control.get_time_lock_status()))
@@ -717,19 +934,21 @@ class n3xx(ZynqComponents, PeriphManagerBase):
 
         Will throw if it's not a valid value.
         """
-        if freq not in (10e6, 20e6, 25e6):
-            self.log.error("{} is not a supported external reference clock frequency!" \
-                           .format(freq/1e6))
-            raise RuntimeError("{} is not a supported external reference clock " \
-                               "frequency!".format(freq/1e6))
-        self.log.debug("We've been told the external reference clock " \
-                       "frequency is now {} MHz.".format(freq/1e6))
+        if freq not in N3XX_EXT_CLOCK_FREQS:
+            error_msg = "{} is not a supported external reference clock " \
+                        "frequency!".format(freq/1e6)
+            self.log.error(error_msg)
+            raise RuntimeError(error_msg)
+        self.log.debug("We've been told the external reference clock "
+                       "frequency is now %s MHz.", freq/1e6)
         if self._ext_clock_freq == freq:
             self.log.trace("New external reference clock frequency " \
                            "assignment matches previous assignment. Ignoring " \
                            "update command.")
             return
-        if (freq == 20e6) and (self.get_time_source() != 'external'):
+        time_source = self.get_time_source()
+        clock_source = self.get_clock_source()
+        if (freq == 20e6) and (time_source != 'external'):
             self.log.error("Setting the external reference clock to {} MHz is only " \
                            "allowed when using 'external' time_source. Set the " \
                            "time_source to 'external' first, and then set the new " \
@@ -738,18 +957,27 @@ class n3xx(ZynqComponents, PeriphManagerBase):
                                "only allowed when using 'external' time_source." \
                                .format(freq/1e6))
         self._ext_clock_freq = freq
+        self._update_ref_clock_freq()
         # If the external source is currently selected we also need to re-apply the
         # time_source. This call also updates the dboards' rates.
-        if self.get_clock_source() == 'external':
-            self.set_time_source(self.get_time_source())
+        if clock_source == 'external':
+            self.set_time_source(time_source)
 
     def get_ref_clock_freq(self):
         " Returns the currently active reference clock frequency"
-        return {
+        return self._ref_clock_freq
+
+    def _update_ref_clock_freq(self):
+        """
+        Update the reference clock frequency returned by get_ref_clock_freq().
+        Call this whenever the clock source or the external reference clock
+        frequency change.
+        """
+        self._ref_clock_freq = {
             'internal': 25e6,
             'external': self._ext_clock_freq,
             'gpsdo': 20e6,
-        }[self._clock_source]
+        }.get(self._clock_source)
 
     def set_fp_gpio_master(self, value):
         """set driver for front panel GPIO
@@ -786,6 +1014,21 @@ class n3xx(ZynqComponents, PeriphManagerBase):
            11: means the pin is driven by radio 3
         """
         return self.mboard_regs_control.get_fp_gpio_radio_src()
+
+    def set_fp_gpio_config(self, master, radio_src):
+        """set driver and radio source for front panel GPIO in one go.
+        Arguments:
+            master {unsigned} -- see set_fp_gpio_master()
+            radio_src {unsigned} -- see set_fp_gpio_radio_src()
+        """
+        self.mboard_regs_control.set_fp_gpio_config(master, radio_src)
+
+    def get_fp_gpio_config(self):
+        """get driver and radio source for front panel GPIO in one go.
+           The return value is a tuple (master, radio_src), see
+           get_fp_gpio_master() and get_fp_gpio_radio_src().
+        """
+        return self.mboard_regs_control.get_fp_gpio_config()
     ###########################################################################
     # Hardware periphal controls
     ###########################################################################
@@ -797,43 +1040,43 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         """
         Turn power to the GPS off or on.
         """
-        self.log.trace("{} power to GPS".format(
-            "Enabling" if enable else "Disabling"
-        ))
-        self._gpios.set("PWREN-GPS", int(bool(enable)))
+        self.log.trace("%s power to GPS",
+                       "Enabling" if enable else "Disabling")
+        self._gpios.set("PWREN-GPS", 1 if enable else 0)
 
     def enable_fp_gpio(self, enable):
         """
         Turn power to the front panel GPIO off or on.
         """
-        self.log.trace("{} power to front-panel GPIO".format(
-            "Enabling" if enable else "Disabling"
-        ))
-        self._gpios.set("FPGA-GPIO-EN", int(bool(enable)))
+        self.log.trace("%s power to front-panel GPIO",
+                       "Enabling" if enable else "Disabling")
+        self._gpios.set("FPGA-GPIO-EN", 1 if enable else 0)
 
     def enable_ref_clock(self, enable):
         """
         Enables the ref clock voltage (+3.3-MAINREF). Without setting this to
         True, *no* ref clock works.
         """
-        self.log.trace("{} power to reference clocks".format(
-            "Enabling" if enable else "Disabling"
-        ))
-        self._gpios.set("PWREN-CLK-MAINREF", int(bool(enable)))
+        self.log.trace("%s power to reference clocks",
+                       "Enabling" if enable else "Disabling")
+        self._gpios.set("PWREN-CLK-MAINREF", 1 if enable else 0)
 
     def enable_1g_ref_clock(self):
         """
         Enables 125 MHz refclock for 1G interface.
         """
         self.log.trace("Enable 125 MHz Clock for 1G SFP interface.")
-        self._gpios.set("NETCLK-CE", 1)
-        self._gpios.set("NETCLK-RESETn", 0)
-        self._gpios.set("NETCLK-PR0", 1)
-        self._gpios.set("NETCLK-PR1", 1)
-        self._gpios.set("NETCLK-OD0", 1)
-        self._gpios.set("NETCLK-OD1", 1)
-        self._gpios.set("NETCLK-OD2", 0)
-        self._gpios.set("PWREN-CLK-WB-25MHz", 1)
+        # Put the CDCM into reset and configure it in one go. Pins that
+        # already have the right value won't be written again.
+        with self._gpios.batch():
+            self._gpios.set("NETCLK-CE", 1)
+            self._gpios.set("NETCLK-RESETn", 0)
+            self._gpios.set("NETCLK-PR0", 1)
+            self._gpios.set("NETCLK-PR1", 1)
+            self._gpios.set("NETCLK-OD0", 1)
+            self._gpios.set("NETCLK-OD1", 1)
+            self._gpios.set("NETCLK-OD2", 0)
+            self._gpios.set("PWREN-CLK-WB-25MHz", 1)
         self.log.trace("Finished configuring NETCLK CDCM.")
         self._gpios.set("NETCLK-RESETn", 1)
 
@@ -856,73 +1099,95 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         combined lock status of all daughterboards. If no dboard is connected,
         or none has a ref lock sensor, we simply return True.
         """
+        if not self._ref_lock_getters:
+            return dict(self._REF_LOCKED_SENSOR)
         self.log.trace(
             "Querying ref lock status from %d dboards.",
             len(self.dboards)
         )
         lock_status = all([
-            not hasattr(db, 'get_ref_lock') or db.get_ref_lock()
-            for db in self.dboards
+            get_ref_lock() for get_ref_lock in self._ref_lock_getters
         ])
-        return {
-            'name': 'ref_locked',
-            'type': 'BOOLEAN',
-            'unit': 'locked' if lock_status else 'unlocked',
-            'value': str(lock_status).lower(),
-        }
+        if lock_status:
+            return dict(self._REF_LOCKED_SENSOR)
+        return dict(self._REF_UNLOCKED_SENSOR)
+
+    def _read_thermal_values(self, max_age=N3XX_THERMAL_CACHE_TIME):
+        """
+        Returns a tuple (FPGA temperature, fan speed) as strings. Both values
+        are read together and cached. If the cached values are older than
+        max_age seconds, they are read again. The status monitor thread
+        refreshes them regularly, so clients polling the sensors usually
+        don't touch the thermal subsystem at all. A value that can't be read
+        is reported as '-1'. Holds the thermal lock, so the sensor files
+        can't be closed while we read them.
+        """
+        with self._thermal_lock:
+            now = time.monotonic()
+            if self._thermal_timestamp is not None and \
+                    now - self._thermal_timestamp < max_age:
+                return self._thermal_values
+            self.log.trace("Reading FPGA temperature and cooling device.")
+            temp_val = '-1'
+            try:
+                raw_val = self._read_thermal_sensor(
+                    self._temp_fd, 'fpga-thermal-zone', 'temp')
+                temp_val = str(raw_val/1000)
+                self._thermal_read_errors.discard('fpga-thermal-zone')
+            except ValueError:
+                self._log_thermal_read_error(
+                    'fpga-thermal-zone', "Error when converting temperature value")
+            except (KeyError, IndexError, OSError):
+                self._log_thermal_read_error(
+                    'fpga-thermal-zone', "Can't read temp on fpga-thermal-zone")
+            fan_val = '-1'
+            try:
+                raw_val = self._read_thermal_sensor(
+                    self._fan_fd, 'ec-fan0', 'cur_state')
+                fan_val = str(raw_val)
+                self._thermal_read_errors.discard('ec-fan0')
+            except ValueError:
+                self._log_thermal_read_error(
+                    'ec-fan0', "Error when converting fan speed value")
+            except (KeyError, IndexError, OSError):
+                self._log_thermal_read_error(
+                    'ec-fan0', "Can't read cur_state on ec-fan0")
+            self._thermal_values = (temp_val, fan_val)
+            self._thermal_timestamp = now
+            return self._thermal_values
+
+    def _log_thermal_read_error(self, sensor_type, msg):
+        """
+        Log a thermal sensor read error. Only the first of consecutive
+        failures of a sensor is a warning, the status monitor thread would
+        otherwise warn about a missing sensor every second.
+        """
+        if sensor_type in self._thermal_read_errors:
+            self.log.debug(msg)
+        else:
+            self._thermal_read_errors.add(sensor_type)
+            self.log.warning(msg)
 
     def get_temp_sensor(self):
         """
         Get temperature sensor reading of the N3xx.
         """
-        self.log.trace("Reading FPGA temperature.")
-        return_val = '-1'
-        try:
-            raw_val = read_thermal_sensor_value('fpga-thermal-zone', 'temp')
-            return_val = str(raw_val/1000)
-        except ValueError:
-            self.log.warning("Error when converting temperature value")
-        except KeyError:
-            self.log.warning("Can't read temp on fpga-thermal-zone")
-        return {
-            'name': 'temperature',
-            'type': 'REALNUM',
-            'unit': 'C',
-            'value': return_val
-        }
+        return dict(self._TEMP_SENSOR, value=self._read_thermal_values()[0])
 
     def get_fan_sensor(self):
         """
         Get cooling device reading of N3xx. In this case the speed of fan 0.
         """
-        self.log.trace("Reading FPGA cooling device.")
-        return_val = '-1'
-        try:
-            raw_val = read_thermal_sensor_value('ec-fan0', 'cur_state')
-            return_val = str(raw_val)
-        except ValueError:
-            self.log.warning("Error when converting fan speed value")
-        except KeyError:
-            self.log.warning("Can't read cur_state on ec-fan0")
-        return {
-            'name': 'cooling fan',
-            'type': 'INTEGER',
-            'unit': 'rpm',
-            'value': return_val
-        }
+        return dict(self._FAN_SENSOR, value=self._read_thermal_values()[1])
 
     def get_gps_lock_sensor(self):
         """
         Get lock status of GPS as a sensor dict
         """
         self.log.trace("Reading status GPS lock pin from port expander")
-        gps_locked = bool(self._gpios.get("GPS-LOCKOK"))
-        return {
-            'name': 'gps_lock',
-            'type': 'BOOLEAN',
-            'unit': 'locked' if gps_locked else 'unlocked',
-            'value': str(gps_locked).lower(),
-        }
+        if self._gpios.get("GPS-LOCKOK"):
+            return dict(self._GPS_LOCKED_SENSOR)
+        return dict(self._GPS_UNLOCKED_SENSOR)
 
     ###########################################################################
     # EEPROMs
@@ -957,16 +1222,26 @@ class n3xx(ZynqComponents, PeriphManagerBase):
                         "in get_db_eeprom()!".format(dboard_idx)
             self.log.error(error_msg)
             raise RuntimeError(error_msg)
-        db_eeprom_data = copy.copy(dboard.device_info)
-        if hasattr(dboard, 'get_user_eeprom_data') and \
-                callable(dboard.get_user_eeprom_data):
-            for blob_id, blob in iteritems(dboard.get_user_eeprom_data()):
-                if blob_id in db_eeprom_data:
-                    self.log.warn("EEPROM user data contains invalid blob ID " \
-                                  "%s", blob_id)
-                else:
-                    db_eeprom_data[blob_id] = blob
-        return db_eeprom_data
+        # The EEPROM contents only change through set_db_eeprom(), so we only
+        # need to read them once
+        if dboard_idx not in self._db_eeprom_cache:
+            self._db_eeprom_cache[dboard_idx] = self._read_db_eeprom(dboard)
+        return dict(self._db_eeprom_cache[dboard_idx])
+
+    def _read_db_eeprom(self, dboard):
+        """
+        Return the EEPROM contents of dboard, i.e., its device info merged
+        with its user data (if any).
+        """
+        if not hasattr(dboard, 'get_user_eeprom_data') or \
+                not callable(dboard.get_user_eeprom_data):
+            return dict(dboard.device_info)
+        user_eeprom_data = dboard.get_user_eeprom_data()
+        for blob_id in user_eeprom_data.keys() & dboard.device_info.keys():
+            self.log.warn("EEPROM user data contains invalid blob ID " \
+                          "%s", blob_id)
+        # On collisions, the device info wins
+        return {**user_eeprom_data, **dboard.device_info}
 
     def set_db_eeprom(self, dboard_idx, eeprom_data):
         """
@@ -990,20 +1265,21 @@ class n3xx(ZynqComponents, PeriphManagerBase):
             self.log.error(error_msg)
             raise RuntimeError(error_msg)
         safe_db_eeprom_user_data = {}
-        for blob_id, blob in iteritems(eeprom_data):
-            if blob_id in dboard.device_info:
+        read_only_data = dboard.device_info
+        for blob_id, blob in eeprom_data.items():
+            if blob_id in read_only_data:
                 error_msg = "Trying to overwrite read-only EEPROM " \
                             "entry `{}'!".format(blob_id)
                 self.log.error(error_msg)
                 raise RuntimeError(error_msg)
-            if not isinstance(blob, str) and not isinstance(blob, bytes):
+            if not isinstance(blob, str):
                 error_msg = "Blob data for ID `{}' is not a " \
                             "string!".format(blob_id)
                 self.log.error(error_msg)
                 raise RuntimeError(error_msg)
-            assert isinstance(blob, str)
             safe_db_eeprom_user_data[blob_id] = blob.encode('ascii')
         dboard.set_user_eeprom_data(safe_db_eeprom_user_data)
+        self._db_eeprom_cache.pop(dboard_idx, None)
 
     ###########################################################################
     # Component updating
@@ -1013,8 +1289,9 @@ class n3xx(ZynqComponents, PeriphManagerBase):
     def _update_fpga_type(self):
         """Update the fpga type stored in the updateable components"""
         fpga_type = self.mboard_regs_control.get_fpga_type()
-        self.log.debug("Updating mboard FPGA type info to {}".format(fpga_type))
+        self.log.debug("Updating mboard FPGA type info to %s", fpga_type)
         self.updateable_components['fpga']['type'] = fpga_type
+        self._fpga_info = None
 
     #######################################################################
     # Claimer API
@@ -8,6 +8,7 @@ N3xx peripherals
 """
 
 import datetime
+from contextlib import contextmanager
 from usrp_mpm import lib
 from usrp_mpm.sys_utils.sysfs_gpio import SysFSGPIO, GPIOBank
 from usrp_mpm.sys_utils.uio import UIO
@@ -100,16 +101,61 @@ class TCA6424(object):
             self.pins = self.pins_list[0]
         else:
             self.pins = self.pins_list[1]
+        # Pin name -> pin index, so we don't have to search self.pins
+        self._pin_idx = {name: idx for idx, name in enumerate(self.pins)}
 
         default_val = 0x860101 if rev == 2 else 0x860780
-        self._gpios = SysFSGPIO({'label': 'tca6424', 'device/of_node/name': 'gpio'}, 0xFFF7FF, 0x86F7FF, default_val)
+        ddr = 0x86F7FF
+        self._gpios = SysFSGPIO({'label': 'tca6424', 'device/of_node/name': 'gpio'}, 0xFFF7FF, ddr, default_val)
+        # Last value written to every output pin, starting with the values
+        # SysFSGPIO.init() put on them
+        self._out_vals = {
+            name: int(bool(default_val & (1 << idx)))
+            for idx, name in enumerate(self.pins)
+            if ddr & (1 << idx)
+        }
+        # List of (name, value) writes deferred by batch(), or None
+        self._pending = None
+
+    @contextmanager
+    def batch(self):
+        """
+        Defer all pin writes until the end of the with block, then apply
+        them in order. Writes that would not change the value of a pin are
+        skipped, saving an I2C transaction each.
+
+        >>> with tca6424.batch():
+        ...     tca6424.set("CLK-MAINSEL-EX_B")
+        ...     tca6424.reset("CLK-MAINSEL-GPS")
+        """
+        if self._pending is not None:
+            # Nested batch: The outermost one applies the writes
+            yield self
+            return
+        self._pending = []
+        try:
+            yield self
+        finally:
+            pending, self._pending = self._pending, None
+            for name, value in pending:
+                if self._out_vals.get(name) != value:
+                    self._write(name, value)
+
+    def _write(self, name, value):
+        " Write a pin immediately and remember its value "
+        self._gpios.set(self._pin_idx[name], value=value)
+        self._out_vals[name] = value
 
     def set(self, name, value=None):
         """
         Assert a pin by name
         """
-        assert name in self.pins
-        self._gpios.set(self.pins.index(name), value=value)
+        assert name in self._pin_idx
+        value = 1 if value is None else int(value)
+        if self._pending is not None:
+            self._pending.append((name, value))
+        else:
+            self._write(name, value)
 
     def reset(self, name):
         """
@@ -121,8 +167,8 @@ class TCA6424(object):
         """
         Read back a pin by name
         """
-        assert name in self.pins
-        return self._gpios.get(self.pins.index(name))
+        assert name in self._pin_idx
+        return self._gpios.get(self._pin_idx[name])
 
 
 class FrontpanelGPIO(GPIOBank):
@@ -201,6 +247,15 @@ class MboardRegsControl(object):
         )
         self.poke32 = self.regs.poke32
         self.peek32 = self.regs.peek32
+        # These can't change without reloading the bitstream, which also
+        # means re-creating this object, so we only read them once.
+        self._compat_number = None
+        self._git_hash = None
+        self._build_timestamp = None
+        # Shadows of the front panel GPIO registers. Only we write them, so
+        # after the first read-back the getters don't need to touch the bus.
+        self._fp_gpio_master = None
+        self._fp_gpio_radio_src = None
 
     def get_compat_number(self):
         """get FPGA compat number
@@ -209,11 +264,13 @@ class MboardRegsControl(object):
         The return is a tuple of
         2 numbers: (major compat number, minor compat number )
         """
-        with self.regs:
-            compat_number = self.peek32(self.M_COMPAT_NUM)
-        minor = compat_number & 0xff
-        major = (compat_number>>16) & 0xff
-        return (major, minor)
+        if self._compat_number is None:
+            with self.regs:
+                compat_number = self.peek32(self.M_COMPAT_NUM)
+            minor = compat_number & 0xff
+            major = (compat_number>>16) & 0xff
+            self._compat_number = (major, minor)
+        return self._compat_number
 
     def set_fp_gpio_master(self, value):
         """set driver for front panel GPIO
@@ -221,7 +278,8 @@ class MboardRegsControl(object):
             value {unsigned} -- value is a single bit bit mask of 12 pins GPIO
         """
         with self.regs:
-            return self.poke32(self.MB_GPIO_MASTER, value)
+            self.poke32(self.MB_GPIO_MASTER, value)
+        self._fp_gpio_master = value & 0xfff
 
     def get_fp_gpio_master(self):
         """get "who" is driving front panel gpio
@@ -229,8 +287,10 @@ class MboardRegsControl(object):
            0: means the pin is driven by PL
            1: means the pin is driven by PS
         """
-        with self.regs:
-            return self.peek32(self.MB_GPIO_MASTER) & 0xfff
+        if self._fp_gpio_master is None:
+            with self.regs:
+                self._fp_gpio_master = self.peek32(self.MB_GPIO_MASTER) & 0xfff
+        return self._fp_gpio_master
 
     def set_fp_gpio_radio_src(self, value):
         """set driver for front panel GPIO
@@ -242,7 +302,8 @@ class MboardRegsControl(object):
            11: means the pin is driven by radio 3
         """
         with self.regs:
-            return self.poke32(self.MB_GPIO_RADIO_SRC, value)
+            self.poke32(self.MB_GPIO_RADIO_SRC, value)
+        self._fp_gpio_radio_src = value & 0xffffff
 
     def get_fp_gpio_radio_src(self):
         """get which radio is driving front panel gpio
@@ -252,8 +313,33 @@ class MboardRegsControl(object):
            10: means the pin is driven by radio 2
            11: means the pin is driven by radio 3
         """
+        if self._fp_gpio_radio_src is None:
+            with self.regs:
+                self._fp_gpio_radio_src = \
+                    self.peek32(self.MB_GPIO_RADIO_SRC) & 0xffffff
+        return self._fp_gpio_radio_src
+
+    def set_fp_gpio_config(self, master, radio_src):
+        """set the front panel GPIO master and radio source settings with a
+           single register session.
+           See set_fp_gpio_master() and set_fp_gpio_radio_src() for the
+           meaning of the arguments.
+        """
+        with self.regs:
+            self.set_fp_gpio_master(master)
+            self.set_fp_gpio_radio_src(radio_src)
+
+    def get_fp_gpio_config(self):
+        """get the front panel GPIO master and radio source settings with a
+           single register session.
+           The return value is a tuple (master, radio_src), see
+           get_fp_gpio_master() and get_fp_gpio_radio_src().
+        """
         with self.regs:
-            return self.peek32(self.MB_GPIO_RADIO_SRC) & 0xffffff
+            return (
+                self.get_fp_gpio_master(),
+                self.get_fp_gpio_radio_src(),
+            )
 
     def get_build_timestamp(self):
         """
@@ -261,6 +347,15 @@ class MboardRegsControl(object):
         The return is datetime string with the  ISO 8601 format
         (YYYY-MM-DD HH:MM:SS.mmmmmm)
         """
+        if self._build_timestamp is None:
+            self._build_timestamp = self._read_build_timestamp()
+        return self._build_timestamp
+
+    def _read_build_timestamp(self):
+        """
+        Reads the build date/time for the FPGA image from the registers. See
+        get_build_timestamp().
+        """
         with self.regs:
             datestamp_rb = self.peek32(self.MB_DATESTAMP)
         if datestamp_rb > 0:
@@ -283,6 +378,8 @@ class MboardRegsControl(object):
         The return is a tuple of
         2 numbers: (short git hash, bool: is the tree dirty?)
         """
+        if self._git_hash is not None:
+            return self._git_hash
         with self.regs:
             git_hash_rb = self.peek32(self.MB_GIT_HASH)
         git_hash = git_hash_rb & 0x0FFFFFFF
@@ -290,7 +387,8 @@ class MboardRegsControl(object):
         dirtiness_qualifier = 'dirty' if tree_dirty else 'clean'
         self.log.trace("FPGA build GIT Hash: {:07x} ({})".format(
             git_hash, dirtiness_qualifier))
-        return (git_hash, dirtiness_qualifier)
+        self._git_hash = (git_hash, dirtiness_qualifier)
+        return self._git_hash
 
     def set_time_source(self, time_source, ref_clk_freq):
         """
@@ -6,6 +6,7 @@
 sysfs thermal sensors API
 """
 
+import os
 import pyudev
 
 def read_thermal_sensors_value(sensor_type, data_probe):
@@ -41,3 +42,22 @@ def read_thermal_sensor_value(sensor_type, data_probe):
     if not sensor_val:
         raise IndexError("No {} attribute found for {} sensor.".format(data_probe, sensor_type))
     return sensor_val[0]
+
+def get_thermal_sensor_path(sensor_type, data_probe):
+    """
+    This function will return the sysfs path to the attribute data_probe of
+    the first thermal sensor of type sensor_type, or None if there is no such
+    sensor. The file can be kept open and re-read, which avoids having to
+    enumerate the thermal subsystem on every read.
+
+    Arguments:
+    sensor_type -- Is attribute "type" of udev.  This can be fpga-thermal-zone,
+                   magnesium-db0-zone, etc.
+    data_probe -- is one of the attribute of that sensor. This can be 'temp' in
+                  the case of thermal-zone or 'cur_state' in the case of a
+                  cooling device.
+    """
+    for device in pyudev.Context().list_devices(subsystem='thermal') \
+            .match_attribute('type', sensor_type):
+        return os.path.join(device.sys_path, data_probe)
+    return None
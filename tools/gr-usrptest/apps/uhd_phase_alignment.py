@@ -10,14 +10,13 @@ UHD Phase Alignment: Phase alignment test using the UHD Python API.
 
 
 import argparse
+import collections
 from builtins import input
-from datetime import datetime, timedelta
-import itertools as itt
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import time
 import logging
 import numpy as np
-import numpy.random as npr
 import uhd
 
 
@@ -25,6 +24,18 @@ CLOCK_TIMEOUT = 1000  # 1000mS timeout for external clock locking
 INIT_DELAY = 0.05  # 50mS initial delay before transmit
 CMD_DELAY = 0.05  # set a 50mS delay in commands
 NUM_RETRIES = 10  # Number of retries on a given trial before giving up
+TUNE_TIMEOUT = 0.5  # 500mS maximum wait for the LOs to lock after a tune
+LO_LOCK_SETTLE_TIME = 5e-3  # 5mS after the command time before polling LO lock
+LO_LOCK_POLL_INTERVAL = 2e-3  # 2mS between LO lock sensor reads
+LO_LOCK_NUM_READS = 2  # Consecutive locked reads required to accept LO lock
+TRANSIENT_SKIP = 500  # Number of samples to ignore at the start of each capture
+MAX_PENDING_SAVES = 2  # Maximum number of sample sets waiting to be written to disk
+# Stream commands and RX metadata are reused by every capture, only the
+# per-capture fields get updated
+_START_CMD = uhd.types.StreamCMD(uhd.types.StreamMode.start_cont)
+_START_CMD.stream_now = False
+_STOP_CMD = uhd.types.StreamCMD(uhd.types.StreamMode.stop_cont)
+_RX_METADATA = uhd.types.RXMetadata()
 # TODO: Add support for TX phase alignment
 
 
@@ -111,17 +122,20 @@ def parse_args():
 class LogFormatter(logging.Formatter):
     """Log formatter which prints the timestamp with fractional seconds"""
     @staticmethod
-    def pp_now():
-        """Returns a formatted string containing the time of day"""
-        now = datetime.now()
-        return "{:%H:%M}:{:05.2f}".format(now, now.second + now.microsecond / 1e6)
+    def pp_now(timestamp=None):
+        """Returns a formatted string containing the time of day of
+        `timestamp` (seconds since the epoch, defaults to now)"""
+        if timestamp is None:
+            timestamp = time.time()
+        return "{}{:05.2f}".format(
+            time.strftime("%H:%M:", time.localtime(timestamp)), timestamp % 60)
 
     def formatTime(self, record, datefmt=None):
         converter = self.converter(record.created)
         if datefmt:
             formatted_date = converter.strftime(datefmt)
         else:
-            formatted_date = LogFormatter.pp_now()
+            formatted_date = LogFormatter.pp_now(record.created)
         return formatted_date
 
 
@@ -139,14 +153,14 @@ def setup_ref(usrp, ref, num_mboards):
     # Lock onto clock signals for all mboards
     if ref != "internal":
         logger.debug("Now confirming lock on clock signals...")
-        end_time = datetime.now() + timedelta(milliseconds=CLOCK_TIMEOUT)
+        deadline = time.monotonic() + CLOCK_TIMEOUT / 1000
         for i in range(num_mboards):
             if ref == "mimo" and i == 0:
                 continue
-            is_locked = usrp.get_mboard_sensor("ref_locked", i)
-            while (not is_locked) and (datetime.now() < end_time):
-                time.sleep(1e-3)
-                is_locked = usrp.get_mboard_sensor("ref_locked", i)
+            is_locked = usrp.get_mboard_sensor("ref_locked", i).to_bool()
+            while (not is_locked) and (time.monotonic() < deadline):
+                time.sleep(5e-4)
+                is_locked = usrp.get_mboard_sensor("ref_locked", i).to_bool()
             if not is_locked:
                 logger.error("Unable to confirm clock signal locked on board %d", i)
                 return False
@@ -238,18 +252,12 @@ def get_band_limits(start_freq, stop_freq, freq_bands):
     return np.linspace(start_freq, stop_freq, freq_bands+1, endpoint=True)
 
 
-def window(seq, width=2):
-    """Returns a sliding window (of `width` elements) over data from the iterable.
-    s -> (s0,s1,...s[n-1]), (s1,s2,...,sn), ...
-    Itertools example found at https://docs.python.org/release/2.3.5/lib/itertools-example.html
+def get_band_pairs(band_limits):
+    """Return an array of shape (len(band_limits) - 1, 2).
+    Each row holds the start and stop frequency of one band.
+    ex. get_band_pairs([10., 55., 100.]) => [[10., 55.], [55., 100.]]
     """
-    seq_iter = iter(seq)
-    result = tuple(itt.islice(seq_iter, width))
-    if len(result) == width:
-        yield result
-    for elem in seq_iter:
-        result = result[1:] + (elem,)
-        yield result
+    return np.stack([band_limits[:-1], band_limits[1:]], axis=1)
 
 
 def generate_time_spec(usrp, time_delta=0.05):
@@ -271,37 +279,100 @@ def tune_usrp(usrp, freq, channels, delay=CMD_DELAY):
         usrp.set_rx_freq(uhd.types.TuneRequest(freq), chan)
 
 
-def recv_aligned_num_samps(usrp, streamer, num_samps, freq, channels=(0,)):
+def wait_for_lo_lock(usrp, channels, timeout=TUNE_TIMEOUT, delay=CMD_DELAY):
+    """Wait until the LOs of `channels` are locked after a call to tune_usrp()
+
+    `delay` is the command time delay that was used for the tune, the LOs
+    won't be retuned until it has passed. If `channels` is empty (i.e., the
+    daughterboards have no lo_locked sensor), simply wait for `timeout`, like
+    a fixed tune wait. `timeout` includes `delay`.
+    Returns True if all LOs locked (or the fixed wait is over) before the
+    timeout.
+    """
+    if not channels:
+        time.sleep(timeout)
+        return True
+    deadline = time.monotonic() + timeout
+    # Right after the command time, the sensor may still report the lock
+    # state of the previous frequency. Give the retune a moment to take
+    # effect, and require the lock to be seen several times in a row.
+    time.sleep(delay + LO_LOCK_SETTLE_TIME)
+    locked_reads = 0
+    while True:
+        if all(usrp.get_rx_sensor("lo_locked", chan).to_bool()
+               for chan in channels):
+            locked_reads += 1
+            if locked_reads >= LO_LOCK_NUM_READS:
+                return True
+        else:
+            locked_reads = 0
+        if time.monotonic() >= deadline:
+            logger.warning("Timed out waiting for LO lock")
+            return False
+        time.sleep(LO_LOCK_POLL_INTERVAL)
+
+
+def wait_for_save(save_future):
+    """
+    Wait for a save submitted in main() to finish. Returns False (and logs
+    the error) if it failed.
+    """
+    filename, future = save_future
+    try:
+        future.result()
+    except Exception as ex:
+        logger.error("Failed to save samples to %s: %s", filename, str(ex))
+        return False
+    return True
+
+
+def get_recv_buffer(streamer, num_channels, recv_buffer=None):
+    """
+    Return a buffer for streamer.recv() which holds 10 times the streamer's
+    maximum number of samples per packet. If `recv_buffer` is given and large
+    enough, it is returned instead of allocating a new one.
+    """
+    buffer_samps = streamer.get_max_num_samps() * 10
+    if recv_buffer is not None and recv_buffer.shape[1] >= buffer_samps:
+        return recv_buffer
+    return np.empty((num_channels, buffer_samps), dtype=np.complex64)
+
+
+def recv_aligned_num_samps(usrp, streamer, num_samps, recv_buffer, stats_acc,
+                           freq, channels=(0,), result=None):
     """
     RX a finite number of samples from the USRP
     :param usrp: MultiUSRP object
     :param streamer: RX streamer object
     :param num_samps: number of samples to RX
+    :param recv_buffer: numpy array of shape (len(channels), N) used as
+                        scratch buffer for streamer.recv()
+    :param stats_acc: AlignmentStatsAccumulator, it is reset and then fed
+                      with the samples as they are received
     :param freq: RX frequency (Hz)
     :param channels: list of channels to RX on
-    :return: numpy array of complex floating-point samples (fc32)
+    :param result: If given, numpy array of shape (len(channels), num_samps)
+                   to store the received samples in
+    :return: True if all samples were received, and they give valid
+             alignment statistics
     """
-    # Allocate a sample buffer
-    result = np.empty((len(channels), num_samps), dtype=np.complex64)
-
     # Tune to the desired frequency
     tune_usrp(usrp, freq, channels)
 
-    metadata = uhd.types.RXMetadata()
-    buffer_samps = streamer.get_max_num_samps() * 10
-    recv_buffer = np.zeros(
-        (len(channels), buffer_samps), dtype=np.complex64)
+    metadata = _RX_METADATA
     recv_samps = 0
+    stats_acc.reset()
 
-    stream_cmd = uhd.types.StreamCMD(uhd.types.StreamMode.start_cont)
-    stream_cmd.stream_now = False
+    stream_cmd = _START_CMD
     stream_cmd.time_spec = generate_time_spec(usrp)
     stream_cmd.num_samps = num_samps
     streamer.issue_stream_cmd(stream_cmd)
     logger.debug("Sending stream command for T=%.2f", stream_cmd.time_spec.get_real_secs())
 
-    samps = np.array([], dtype=np.complex64)
+    samps = 0
     while recv_samps < num_samps:
+        # The Python binding releases the GIL for the duration of recv(), so
+        # the background save thread keeps running while we wait for samples
         samps = streamer.recv(recv_buffer, metadata)
 
         if metadata.error_code != uhd.types.RXMetadataErrorCode.none:
@@ -312,12 +383,13 @@ def recv_aligned_num_samps(usrp, streamer, num_samps, freq, channels=(0,)):
                 break
 
         real_samps = min(num_samps - recv_samps, samps)
-        result[:, recv_samps:recv_samps + real_samps] = recv_buffer[:, 0:real_samps]
+        stats_acc.update(recv_buffer[:, 0:real_samps])
+        if result is not None:
+            result[:, recv_samps:recv_samps + real_samps] = recv_buffer[:, 0:real_samps]
         recv_samps += real_samps
 
     logger.debug("Stopping stream")
-    stream_cmd = uhd.types.StreamCMD(uhd.types.StreamMode.stop_cont)
-    streamer.issue_stream_cmd(stream_cmd)
+    streamer.issue_stream_cmd(_STOP_CMD)
 
     logger.debug("Flushing stream")
     # Flush the remainder of the samples
@@ -325,9 +397,113 @@ def recv_aligned_num_samps(usrp, streamer, num_samps, freq, channels=(0,)):
         samps = streamer.recv(recv_buffer, metadata)
 
     if recv_samps < num_samps:
-        logger.warning("Received too few samples, returning an empty array")
-        return np.array([], dtype=np.complex64)
-    return result
+        logger.warning("Received too few samples")
+        return False
+    if not stats_acc.is_valid():
+        logger.warning("Received samples give no valid phase alignment")
+        return False
+    return True
+
+
+def get_alignment(samps, phase_diff=None, out=None):
+    """
+    Calculate the phase alignment between the two channels in `samps`
+    :param samps: numpy array of samples of shape (2, N)
+    :param phase_diff: If given, complex64 array of length N used as scratch
+                       buffer for the conjugate product
+    :param out: If given, float32 array of length N to store the result in
+    :return: the phase difference (radians) per sample
+    """
+    # Calculate the conjugate product in place, so we only need one
+    # buffer for it
+    phase_diff = np.conjugate(samps[0], out=phase_diff)
+    np.multiply(phase_diff, samps[1], out=phase_diff)
+    return np.arctan2(phase_diff.imag, phase_diff.real, out=out)
+
+
+class AlignmentStatsAccumulator(object):
+    """
+    Accumulates the phase alignment statistics between two channels over
+    consecutive blocks of samples, so they can be calculated while receiving
+    instead of from a copy of all samples.
+
+    The first `skip` samples after a reset() are ignored (tuning transients).
+    They're only skipped in the first blocks, later blocks are processed
+    without slicing.
+
+    Once a block yields a non-finite result (e.g. NaN samples), the
+    accumulator stops processing and is_valid() returns False until the
+    next reset().
+    """
+    def __init__(self, skip=TRANSIENT_SKIP):
+        self.skip = skip
+        # Scratch buffers, so updating doesn't allocate any temporaries
+        self._cplx_buf = np.empty(0, dtype=np.complex64)
+        self._real_buf = np.empty(0, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        """Start accumulating a new set of samples"""
+        self._to_skip = self.skip
+        self._finite = True
+        self._phasor_sum = 0j
+        self._count = 0
+        self._min = np.inf
+        self._max = -np.inf
+
+    def update(self, samps):
+        """Add a block of samples of shape (2, N)"""
+        if not self._finite:
+            return
+        if self._to_skip:
+            skipped = min(self._to_skip, samps.shape[1])
+            samps = samps[:, skipped:]
+            self._to_skip -= skipped
+        num_samps = samps.shape[1]
+        if not num_samps:
+            return
+        if num_samps > self._cplx_buf.size:
+            self._cplx_buf = np.empty(num_samps, dtype=np.complex64)
+            self._real_buf = np.empty(num_samps, dtype=np.float32)
+        cplx_buf = self._cplx_buf[:num_samps]
+        alignment = get_alignment(samps, cplx_buf, self._real_buf[:num_samps])
+        # The alignment wraps at +-pi, so use circular statistics: sum up
+        # the unit phasors, and derive the mean and stddev from the
+        # resulting complex number instead of from the raw angles
+        np.multiply(alignment, 1j, out=cplx_buf)
+        np.exp(cplx_buf, out=cplx_buf)
+        self._phasor_sum += cplx_buf.sum()
+        if not np.isfinite(self._phasor_sum):
+            self._finite = False
+            return
+        self._count += alignment.size
+        self._min = min(self._min, alignment.min())
+        self._max = max(self._max, alignment.max())
+
+    def is_valid(self):
+        """
+        Return True if samples were accumulated since the last reset(), and
+        all of them produced finite statistics
+        """
+        return self._finite and self._count > 0
+
+    def get_stats(self):
+        """
+        Return the statistics of the samples accumulated since the last
+        reset() as a dictionary with the keys mean, stddev, min, max
+        (radians). They are NaN if no samples were accumulated.
+        """
+        if not self._count:
+            return dict.fromkeys(("mean", "stddev", "min", "max"), np.nan)
+        mean_phasor = self._phasor_sum / self._count
+        # Rounding can push the magnitude slightly above 1
+        resultant_length = min(abs(mean_phasor), 1.0)
+        return {
+            "mean": np.angle(mean_phasor),
+            "stddev": np.sqrt(-2 * np.log(resultant_length)),
+            "min": self._min,
+            "max": self._max,
+        }
 
 
 def plot_samps(samps, alignment):
@@ -359,55 +535,56 @@ def plot_samps(samps, alignment):
     plt.show()
 
 
+def get_circular_drift(angles, axis=-1):
+    """
+    Return the largest difference between the phases in `angles` (radians)
+    along `axis`. The phases are taken relative to their circular mean, so
+    the result is correct even if they straddle +-pi.
+    """
+    reference = np.angle(np.mean(np.exp(1j * angles), axis=axis, keepdims=True))
+    residuals = np.angle(np.exp(1j * (angles - reference)))
+    return residuals.max(axis=axis) - residuals.min(axis=axis)
+
+
 def check_results(alignment_stats, drift_thresh, stddev_thresh):
     """Print the alignment stats in a nice way
 
-    alignment_stats should be a dictionary of the following form:
-    {test_freq : [list of runs], ...}
-    ... the list of runs takes the form:
-    [{dictionary of run statistics}, ...]
-    ... the run dictionary has the following keys:
-    mean, stddev, min, max, test_freq, run_freq
-    ... whose values are all floats
+    alignment_stats should be a dictionary of numpy arrays with the
+    following keys:
+    band_start: Start frequency of each test band, shape (bands,)
+    test_freq: Test frequency of each test band, shape (bands,)
+    run_freq: Tune-away frequency of each run, shape (bands, runs)
+    mean: Mean phase alignment (radians) of each run, shape (bands, runs)
+    stddev: Phase alignment stddev (radians) of each run, shape (bands, runs)
+    Runs which failed to receive samples have a mean and stddev of 0.
     """
-    success = True  # Whether or not we've exceeded a threshold
-    msg = ""
-    for freq, stats_list in alignment_stats.items():
-        # Try to grab the test frequency for the frequency band
-        try:
-            test_freq = stats_list[0].get("test_freq")
-        except (KeyError, IndexError):
-            test_freq = 0.
-            logger.error("Failed to find test frequency for test band %.2fMHz", freq)
-        msg += "=== Frequency band starting at {:.2f}MHz. ===\n".format(freq/1e6)
-        msg += "Test Frequency: {:.2f}MHz ===\n".format(test_freq/1e6)
-
-        # Allocate a list so we can calulate the drift over a set of runs
-        mean_list = []
-
-        for run_dict in stats_list:
-            run_freq = run_dict.get("run_freq", 0.)
-            # Convert mean and stddev to degrees
-            mean_deg = run_dict.get("mean", 0.) * 180 / np.pi
-            stddev_deg = run_dict.get("stddev", 0.) * 180 / np.pi
-            if stddev_deg > stddev_thresh:
-                success = False
-
-            msg += "{:.2f}MHz<-{:.2f}MHz: {:.3f} deg +- {:.3f}\n".format(
-                test_freq/1e6, run_freq/1e6, mean_deg, stddev_deg
-            )
-            mean_list.append(mean_deg)
-
-        # Report the largest difference in mean values of runs
-        # FIXME: This won't work around +-180 deg
-        max_drift = max(mean_list) - min(mean_list)
-        if max_drift > drift_thresh:
-            success = False
-        msg += "--Maximum drift over runs: {:.2f} degrees\n".format(max_drift)
-        # Print a newline to separate frequency bands
-        msg += "\n"
-
-    logger.info("Printing statistics!\n%s", msg)
+    # Convert mean and stddev to degrees
+    means_deg = np.degrees(alignment_stats["mean"])
+    stddevs_deg = np.degrees(alignment_stats["stddev"])
+    # Report the largest difference in mean values of runs
+    max_drifts = np.degrees(get_circular_drift(alignment_stats["mean"], axis=1))
+    # Whether or not we've exceeded a threshold
+    success = not ((stddevs_deg > stddev_thresh).any()
+                   or (max_drifts > drift_thresh).any())
+
+    if logger.isEnabledFor(logging.INFO):
+        msg = ""
+        for band_idx, freq in enumerate(alignment_stats["band_start"]):
+            test_freq = alignment_stats["test_freq"][band_idx]
+            msg += "=== Frequency band starting at {:.2f}MHz. ===\n".format(freq/1e6)
+            msg += "Test Frequency: {:.2f}MHz ===\n".format(test_freq/1e6)
+            for run_freq, mean_deg, stddev_deg in zip(
+                    alignment_stats["run_freq"][band_idx],
+                    means_deg[band_idx],
+                    stddevs_deg[band_idx]):
+                msg += "{:.2f}MHz<-{:.2f}MHz: {:.3f} deg +- {:.3f}\n".format(
+                    test_freq/1e6, run_freq/1e6, mean_deg, stddev_deg
+                )
+            msg += "--Maximum drift over runs: {:.2f} degrees\n".format(
+                max_drifts[band_idx])
+            # Print a newline to separate frequency bands
+            msg += "\n"
+        logger.info("Printing statistics!\n%s", msg)
     return success
 
 
@@ -435,101 +612,143 @@ def main():
 
     # Determine the frequency bands we need to test
     # TODO: allow users to specify test frequencies in args
-    freq_bands = get_band_limits(args.start_freq, args.stop_freq, args.freq_bands)
+    freq_bands = get_band_pairs(
+        get_band_limits(args.start_freq, args.stop_freq, args.freq_bands))
     # Frequency bands to tune away to
     # TODO: make this based on the device's frequency range. This requires
     #       additional Python API bindings.
-    run_bands = get_band_limits(args.start_freq, args.stop_freq, args.runs)
+    run_bands = get_band_pairs(
+        get_band_limits(args.start_freq, args.stop_freq, args.runs))
+    # Pick a random test frequency within each test band, and random
+    # frequencies to tune away to within each run band, for every test band
+    # and retry
+    rng = np.random.default_rng()
+    test_freqs = rng.uniform(freq_bands[:, 0], freq_bands[:, 1])
+    if args.easy_tune:
+        # Round to the nearest MHz
+        test_freqs = np.round(test_freqs, -6)
+    tune_away_freqs = rng.uniform(
+        run_bands[:, 0, np.newaxis], run_bands[:, 1, np.newaxis],
+        size=(len(freq_bands), len(run_bands), NUM_RETRIES))
 
     nsamps = int(args.duration * args.rate)
     st_args = uhd.usrp.StreamArgs("fc32", "sc16")
     st_args.channels = args.channels
     streamer = usrp.get_rx_stream(st_args)
-
-    # Make a big dictionary to store all of the reported statistics
-    # Keys are the starting test frequency of the band
-    # Values are lists of dictionaries of statistics
-    all_alignment_stats = {}
+    # Allocate the sample buffers once, they're reused for every capture. The
+    # stats are calculated while receiving, so we only need to keep all
+    # samples around if we want to plot or save them.
+    if args.plot or args.save:
+        result = np.empty((len(args.channels), nsamps), dtype=np.complex64)
+    else:
+        result = None
+    stats_acc = AlignmentStatsAccumulator()
+    recv_buffer = get_recv_buffer(streamer, len(args.channels))
+    # Samples are written to disk in the background, so the next capture
+    # doesn't have to wait for the file I/O
+    io_pool = ThreadPoolExecutor(max_workers=1) if args.save else None
+    # (filename, future) of the saves which are still in flight. Each holds a
+    # copy of the samples, so we don't let them pile up.
+    pending_saves = collections.deque()
+    saves_ok = True
+    # Only poll the LO lock status on channels which can report it
+    lo_lock_channels = [chan for chan in args.channels
+                        if "lo_locked" in usrp.get_rx_sensor_names(chan)]
+    if not lo_lock_channels:
+        logger.info("No lo_locked sensors available, waiting %.2f s after "
+                    "each tune instead", TUNE_TIMEOUT)
+
+    # Store all of the reported statistics as parallel arrays, indexed by
+    # [test band] or [test band, run] (see check_results())
+    num_test_bands = len(freq_bands)
+    num_runs = len(run_bands)
+    all_alignment_stats = {
+        "band_start": freq_bands[:, 0],
+        "test_freq": test_freqs,
+        "run_freq": np.zeros((num_test_bands, num_runs)),
+        "mean": np.zeros((num_test_bands, num_runs)),
+        "stddev": np.zeros((num_test_bands, num_runs)),
+    }
     # Test phase alignment in each test frequency band
     current_power = args.start_power
-    for freq_start, freq_stop in window(freq_bands):
-        # Pick a random center frequency between the start and stop frequencies
-        tune_freq = npr.uniform(freq_start, freq_stop)
-        if args.easy_tune:
-            # Round to the nearest MHz
-            tune_freq = np.round(tune_freq, -6)
+    for band_idx, tune_freq in enumerate(test_freqs):
         # Request the SigGen tune to our test frequency plus some offset away
         # the device's LO
         tune_siggen(tune_freq + args.tone_offset, current_power)
 
         # This is where the magic happens!
-        # Store phase alignment statistics as a list of dictionaries
-        alignment_stats = []
-        for tune_away_start, tune_away_stop in window(run_bands):
+        for run_idx in range(num_runs):
             # Try to get samples
             for i in range(NUM_RETRIES):
                 # Tune to a random frequency in each of the frequency bands...
-                tune_away_freq = npr.uniform(tune_away_start, tune_away_stop)
+                tune_away_freq = tune_away_freqs[band_idx, run_idx, i]
                 tune_usrp(usrp, tune_away_freq, args.channels)
-                time.sleep(0.5)
+                wait_for_lo_lock(usrp, lo_lock_channels)
 
                 logger.info("Receiving samples, take %d, (%.2fMHz -> %.2fMHz)",
                             i, tune_away_freq/1e6, tune_freq/1e6)
 
                 # Then tune back to our desired test frequency, and receive samples
-                samps = recv_aligned_num_samps(usrp,
-                                               streamer,
-                                               nsamps,
-                                               tune_freq,
-                                               args.channels)
-                if samps.size >= nsamps:
+                if recv_aligned_num_samps(usrp,
+                                          streamer,
+                                          nsamps,
+                                          recv_buffer,
+                                          stats_acc,
+                                          tune_freq,
+                                          args.channels,
+                                          result):
                     break
                 else:
                     streamer = None # Help the garbage collector
                     time.sleep(1)
                     streamer = usrp.get_rx_stream(st_args)
+                    recv_buffer = get_recv_buffer(
+                        streamer, len(args.channels), recv_buffer)
 
-            # If we have failed to get good samples, put an empty dict in the stats
+            # If we have failed to get good samples, leave the stats for this
+            # run at 0
             else:
                 logger.error("Failed to receive aligned samples!")
-                alignment_stats.append({})
                 continue
 
-            alignment = np.angle(np.conj(samps[0]) * samps[1])[500:]
+            run_stats = stats_acc.get_stats()
 
             if args.plot:
-                plot_samps(samps, alignment,)
+                plot_samps(result, get_alignment(result)[stats_acc.skip:])
 
             if args.save:
                 # TODO: add frequency data
-                date_now = datetime.utcnow()
-                epoch = datetime(1970, 1, 1)
-                utc_now = int((date_now - epoch).total_seconds())
-                np.savez("phaseAligned_{}.npz".format(utc_now), samps)
+                # Several runs may finish within the same second, so also put
+                # the band and run index into the file name
+                filename = "phaseAligned_{}_{}_{}.npy".format(
+                    int(time.time()), band_idx, run_idx)
+                if len(pending_saves) >= MAX_PENDING_SAVES:
+                    saves_ok &= wait_for_save(pending_saves.popleft())
+                # result is reused by the next capture, so save a copy
+                pending_saves.append((
+                    filename,
+                    io_pool.submit(np.save, filename, result.copy())))
 
             # Store the phase alignment stats
-            alignment_stats.append({
-                "mean": np.mean(alignment),
-                # Subtract the mean before calculating the stddev so we don't
-                #     have rollover errors
-                "stddev": np.std(alignment - np.mean(alignment)),
-                "min": alignment.min(),
-                "max": alignment.max(),
-                "test_freq": tune_freq,
-                "run_freq": tune_away_freq
-            })
-        run_means = [run_stats.get("mean", 0.) for run_stats in alignment_stats]
-        run_stddevs = [run_stats.get("stddev", 0.) for run_stats in alignment_stats]
+            all_alignment_stats["run_freq"][band_idx, run_idx] = tune_away_freq
+            all_alignment_stats["mean"][band_idx, run_idx] = run_stats["mean"]
+            all_alignment_stats["stddev"][band_idx, run_idx] = run_stats["stddev"]
+        run_means = all_alignment_stats["mean"][band_idx]
+        run_stddevs = all_alignment_stats["stddev"][band_idx]
         logger.debug("Test freq %.3fMHz health check: %.1f deg drift, %.2f deg max stddev",
                      tune_freq/1e6,
-                     max(run_means) - min(run_means), # FIXME: This won't work around +-180 deg
-                     max(run_stddevs)
+                     np.degrees(get_circular_drift(run_means)),
+                     np.degrees(run_stddevs.max())
                     )
-        all_alignment_stats[freq_start] = alignment_stats
         # Increment the power level for the next run
         current_power += args.power_step
 
-    return check_results(all_alignment_stats, args.drift_threshold, args.stddev_threshold)
+    if io_pool is not None:
+        while pending_saves:
+            saves_ok &= wait_for_save(pending_saves.popleft())
+        io_pool.shutdown(wait=True)
+    return check_results(all_alignment_stats, args.drift_threshold, args.stddev_threshold) \
+        and saves_ok
 
 
 if __name__ == "__main__":